@@ -3,13 +3,16 @@ from __future__ import annotations
 import logging
 import time
 import uuid
+
+import orjson
 from typing import Dict, Any
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import RedirectResponse
 
 from .services import handle_casdoor_callback
 from .casdoor_utils import get_casdoor_login_url
-from .webhook_services import handle_casdoor_logout_webhook
+from .webhook_services import CasdoorWebhookPayload
+from .webhook_queue import accepting_webhooks, enqueue_webhook
 from .oauth_state import create_secure_state, validate_callback_state, process_oauth_callback_safely
 from apps.core.error_handling import create_safe_redirect, safe_api_operation
 from conf.enhanced_logging import get_logger
@@ -192,7 +195,7 @@ async def casdoor_webhook(request: Request):
             "content_type": request.headers.get("content-type", "unknown")
         })
         
-        payload = await request.json()
+        payload = orjson.loads(await request.body())
         
         logger.info("Webhook payload parsed", extra={
             "webhook_id": webhook_id,
@@ -203,13 +206,24 @@ async def casdoor_webhook(request: Request):
             "payload_keys": list(payload.keys()) if payload else []
         })
         
-        # Handle the webhook
-        result = await handle_casdoor_logout_webhook(payload)
+        # Only logout events need processing; everything else is acknowledged as ignored
+        user_email = None
+        if payload.get("action") != "logout":
+            result = {"status": "ignored", "reason": "not_logout_event"}
+        elif not accepting_webhooks():
+            # Shutting down: refuse so Casdoor retries against the next instance
+            raise HTTPException(status_code=503, detail="Shutting down, retry later")
+        elif enqueue_webhook(payload):
+            # Acknowledge immediately; the n8n logout runs in a background worker
+            result = {"status": "accepted"}
+            user_email = CasdoorWebhookPayload(payload).user_email
+        else:
+            raise HTTPException(status_code=429, detail="Webhook queue is full, retry later")
         
-        logger.info("Webhook processed successfully", extra={
+        logger.info("Webhook acknowledged", extra={
             "webhook_id": webhook_id,
-            "result_status": result.get("status") if isinstance(result, dict) else "unknown",
-            "user_email": result.get("user_email") if isinstance(result, dict) else None
+            "result_status": result["status"],
+            "email": user_email
         })
         
         return {
@@ -219,6 +233,8 @@ async def casdoor_webhook(request: Request):
             "result": result
         }
         
+    except HTTPException:
+        raise
     except ValueError as json_exc:
         logger.critical("Invalid JSON in webhook payload", extra={
             "webhook_id": webhook_id,
@@ -264,12 +280,11 @@ async def casdoor_logout(request: Request):
         # Logout from n8n
         n8n_client = N8NClient(base_url=str(settings.N8N_BASE_URL))
         try:
-            logout_response = n8n_client.logout_user(auth_cookie)
+            logout_response = await n8n_client.logout_user(auth_cookie)
             logger.info("Manual n8n logout completed", extra={
                 "logout_id": logout_id,
                 "status_code": logout_response.status_code,
-                "logout_successful": logout_response.status_code < 400,
-                "response_text": logout_response.text[:100] if logout_response.text else "no response"
+                "logout_successful": logout_response.status_code < 400
             })
         except Exception as logout_exc:
             logger.error("Manual n8n logout failed", extra={
@@ -277,8 +292,6 @@ async def casdoor_logout(request: Request):
                 "error": str(logout_exc),
                 "error_type": type(logout_exc).__name__
             })
-        finally:
-            n8n_client.close()
         
         # Redirect to Casdoor logout
         casdoor_logout_url = f"{str(settings.CASDOOR_ENDPOINT).rstrip('/')}/logout"
@@ -9,6 +9,7 @@ import asyncio
 import requests
 import jwt
 import httpx
+import orjson
 from typing import Any, Dict
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
@@ -22,6 +23,7 @@ from apps.integrations.n8n_db import (
     rotate_user_password
 )
 from apps.integrations.n8n_client import N8NClient
+from apps.core.http_utils import no_cookie_jar
 from conf.settings import get_settings
 from conf.enhanced_logging import get_logger
 from apps.core.error_handling import create_safe_redirect, log_and_redirect_on_error
@@ -29,6 +31,31 @@ from apps.auth.oauth_state import SessionManager
 
 logger = get_logger(__name__)
 
+# Shared client for Casdoor token requests (created once, so the TLS context
+# and keep-alive connections are reused across logins)
+_casdoor_client: httpx.AsyncClient | None = None
+
+def get_casdoor_client() -> httpx.AsyncClient:
+    """Get the shared Casdoor AsyncClient, creating it on first use."""
+    global _casdoor_client
+    if _casdoor_client is None:
+        _casdoor_client = httpx.AsyncClient(
+            timeout=10.0,
+            # Shared by every login, so Casdoor cookies must never be replayed
+            cookies=no_cookie_jar(),
+        )
+    return _casdoor_client
+
+async def close_casdoor_client() -> None:
+    """Close the shared Casdoor AsyncClient (called on application shutdown)."""
+    global _casdoor_client
+    if _casdoor_client is not None:
+        try:
+            await _casdoor_client.aclose()
+        except Exception:
+            pass
+        _casdoor_client = None
+
 def extract_n8n_auth_cookie(response) -> str | None:
     """Extract n8n-auth cookie from httpx Response with enhanced error handling."""
     if not response:
@@ -117,128 +144,127 @@ async def get_oauth_token(code: str, request_id: str = None):
         "code_preview": code[:10] + "..." if code and len(code) > 10 else code
     })
     
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        for attempt in range(max_retries):
-            try:
-                response = await client.post(url, data=payload)
-                
-                logger.info("OAuth token request attempt", extra={
-                    "attempt": attempt + 1,
-                    "status_code": response.status_code,
-                    "response_size": len(response.content) if response.content else 0,
-                    "response_headers": dict(response.headers)
-                })
-                
-                if response.status_code == 200:
-                    try:
-                        token_data = response.json()
-                        
-                        # Log success with token info (but mask sensitive data)
-                        logger.info("OAuth token obtained successfully", extra={
-                            "attempt": attempt + 1,
-                            "has_access_token": "access_token" in token_data,
-                            "has_id_token": "id_token" in token_data,
-                            "token_type": token_data.get("token_type"),
-                            "expires_in": token_data.get("expires_in"),
-                            "id_token_length": len(token_data.get("id_token", "")) if token_data.get("id_token") else 0
-                        })
-                        
-                        return token_data
-                        
-                    except ValueError as json_error:
-                        logger.error("Failed to parse JSON response", extra={
-                            "attempt": attempt + 1,
-                            "status_code": response.status_code,
-                            "response_text": response.text[:500],  # First 500 chars
-                            "json_error": str(json_error)
-                        })
-                        
-                        if attempt == max_retries - 1:
-                            return create_safe_redirect(
-                                error=ValueError(f"Invalid JSON response from Casdoor: {str(json_error)}"),
-                                flash_message="Authentication failed. Please try again.",
-                                context={
-                                    "operation": "get_oauth_token",
-                                    "error_type": "json_parse_error",
-                                    "status_code": response.status_code
-                                },
-                                request_id=request_id
-                            )
-                else:
-                    # Check for invalid_grant error
-                    if response.status_code == 400:
-                        try:
-                            error_data = response.json()
-                            if error_data.get("error") == "invalid_grant" and "authorization code has been used" in error_data.get("error_description", ""):
-                                # Code already used, don't retry - return redirect instead of raising
-                                logger.warning("Authorization code already used", extra={
-                                    "attempt": attempt + 1,
-                                    "code": code,
-                                    "error": error_data
-                                })
-                                return create_safe_redirect(
-                                    error=ValueError("Authorization code already used"),
-                                    flash_message="Login session expired. Please try again.",
-                                    context={
-                                        "operation": "get_oauth_token",
-                                        "error_type": "invalid_grant",
-                                        "code": code
-                                    },
-                                    request_id=request_id
-                                )
-                        except ValueError:
-                            pass  # Not JSON, handle as normal
+    client = get_casdoor_client()
+    for attempt in range(max_retries):
+        try:
+            response = await client.post(url, data=payload)
+            
+            logger.info("OAuth token request attempt", extra={
+                "attempt": attempt + 1,
+                "status_code": response.status_code,
+                "response_size": len(response.content) if response.content else 0
+            })
+            
+            if response.status_code == 200:
+                try:
+                    token_data = orjson.loads(response.content)
+                    
+                    # Log success with token info (but mask sensitive data)
+                    logger.info("OAuth token obtained successfully", extra={
+                        "attempt": attempt + 1,
+                        "has_access_token": "access_token" in token_data,
+                        "has_id_token": "id_token" in token_data,
+                        "token_type": token_data.get("token_type"),
+                        "expires_in": token_data.get("expires_in"),
+                        "id_token_length": len(token_data.get("id_token", "")) if token_data.get("id_token") else 0
+                    })
+                    
+                    return token_data
                     
-                    # Log non-200 response
-                    logger.warning("OAuth token request failed", extra={
+                except ValueError as json_error:
+                    logger.error("Failed to parse JSON response", extra={
                         "attempt": attempt + 1,
                         "status_code": response.status_code,
                         "response_text": response.text[:500],  # First 500 chars
-                        "response_headers": dict(response.headers)
+                        "json_error": str(json_error)
                     })
                     
                     if attempt == max_retries - 1:
-                        # Final attempt failed - return redirect instead of raising
                         return create_safe_redirect(
-                            error=RuntimeError(f"Failed to obtain token after {max_retries} attempts. Last status: {response.status_code}"),
-                            flash_message="Authentication service unavailable. Please try again later.",
+                            error=ValueError(f"Invalid JSON response from Casdoor: {str(json_error)}"),
+                            flash_message="Authentication failed. Please try again.",
                             context={
                                 "operation": "get_oauth_token",
-                                "error_type": "max_retries_exceeded",
-                                "status_code": response.status_code,
-                                "response_text": response.text[:200]
+                                "error_type": "json_parse_error",
+                                "status_code": response.status_code
                             },
                             request_id=request_id
                         )
-            
-            except httpx.RequestError as req_error:
-                logger.error("OAuth token request network error", extra={
+            else:
+                # Check for invalid_grant error
+                if response.status_code == 400:
+                    try:
+                        error_data = orjson.loads(response.content)
+                        if error_data.get("error") == "invalid_grant" and "authorization code has been used" in error_data.get("error_description", ""):
+                            # Code already used, don't retry - return redirect instead of raising
+                            logger.warning("Authorization code already used", extra={
+                                "attempt": attempt + 1,
+                                "code": code,
+                                "error": error_data
+                            })
+                            return create_safe_redirect(
+                                error=ValueError("Authorization code already used"),
+                                flash_message="Login session expired. Please try again.",
+                                context={
+                                    "operation": "get_oauth_token",
+                                    "error_type": "invalid_grant",
+                                    "code": code
+                                },
+                                request_id=request_id
+                            )
+                    except ValueError:
+                        pass  # Not JSON, handle as normal
+                
+                # Log non-200 response
+                logger.warning("OAuth token request failed", extra={
                     "attempt": attempt + 1,
-                    "error": str(req_error),
-                    "url": url
+                    "status_code": response.status_code,
+                    "response_text": response.text[:500],  # First 500 chars
+                    "response_headers": dict(response.headers)
                 })
                 
                 if attempt == max_retries - 1:
+                    # Final attempt failed - return redirect instead of raising
                     return create_safe_redirect(
-                        error=req_error,
-                        flash_message="Network error during authentication. Please try again.",
+                        error=RuntimeError(f"Failed to obtain token after {max_retries} attempts. Last status: {response.status_code}"),
+                        flash_message="Authentication service unavailable. Please try again later.",
                         context={
                             "operation": "get_oauth_token",
-                            "error_type": "network_error",
-                            "url": url
+                            "error_type": "max_retries_exceeded",
+                            "status_code": response.status_code,
+                            "response_text": response.text[:200]
                         },
                         request_id=request_id
                     )
+        
+        except httpx.RequestError as req_error:
+            logger.error("OAuth token request network error", extra={
+                "attempt": attempt + 1,
+                "error": str(req_error),
+                "url": url
+            })
             
-            # Wait before retrying (exponential backoff)
-            if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)  # 1s, 2s, 4s
-                logger.info("Retrying OAuth token request", extra={
-                    "attempt": attempt + 1,
-                    "next_attempt_in": delay,
-                    "max_retries": max_retries
-                })
-                await asyncio.sleep(delay)
+            if attempt == max_retries - 1:
+                return create_safe_redirect(
+                    error=req_error,
+                    flash_message="Network error during authentication. Please try again.",
+                    context={
+                        "operation": "get_oauth_token",
+                        "error_type": "network_error",
+                        "url": url
+                    },
+                    request_id=request_id
+                )
+        
+        # Wait before retrying (exponential backoff)
+        if attempt < max_retries - 1:
+            delay = base_delay * (2 ** attempt)  # 1s, 2s, 4s
+            logger.info("Retrying OAuth token request", extra={
+                "attempt": attempt + 1,
+                "next_attempt_in": delay,
+                "max_retries": max_retries
+            })
+            await asyncio.sleep(delay)
 
 
 def parse_jwt_token(token: str, request_id: str = None):
@@ -471,7 +497,7 @@ async def handle_casdoor_callback(request: Request) -> RedirectResponse:
         logger.info("n8n user/project ensured", extra={
             "request_id": request_id,
             "email": profile.email,
-            "user_id": str(user_row.id),
+            "user_id": user_row.id,
             "project_id": project_row.id,
             "is_new_user": temp_password is not None
         })
@@ -483,7 +509,7 @@ async def handle_casdoor_callback(request: Request) -> RedirectResponse:
             await rotate_user_password(user_row.id, temp_password)
             logger.info("Rotated password for existing user", extra={
                 "request_id": request_id,
-                "user_id": str(user_row.id)
+                "user_id": user_row.id
             })
 
         # Check if user already has a local session (for tracking only)
@@ -598,7 +624,7 @@ async def handle_casdoor_callback(request: Request) -> RedirectResponse:
                     "attempt": attempt + 1,
                     "max_retries": max_retries
                 })
-                login_response = n8n_client.login_user(profile.email, temp_password)
+                login_response = await n8n_client.login_user(profile.email, temp_password)
                 
                 # Extract the n8n-auth cookie from the login response
                 auth_cookie = extract_n8n_auth_cookie(login_response)
@@ -647,16 +673,9 @@ async def handle_casdoor_callback(request: Request) -> RedirectResponse:
             "status_code": getattr(login_response, 'status_code', 'unknown') if 'login_response' in locals() else 'unknown',
             "has_auth_cookie": auth_cookie is not None,
             "cookie_length": len(auth_cookie) if auth_cookie else 0,
-            "total_attempts": max_retries,
-            "response_headers": dict(getattr(login_response, 'headers', {})) if 'login_response' in locals() else {}
+            "total_attempts": max_retries
         })
         
-        # Always close the client
-        try:
-            n8n_client.close()
-        except Exception:
-            pass  # Ignore cleanup errors
-        
         # 7. Create redirect response with cookie setting
         n8n_base_url = str(settings.N8N_BASE_URL).rstrip('/')
         n8n_workflows_url = f"{n8n_base_url}/home/workflows"
@@ -0,0 +1,106 @@
+"""Background queue for Casdoor webhook processing.
+
+The webhook endpoint only validates and enqueues payloads so Casdoor gets an
+immediate acknowledgement; a small pool of worker tasks drains the queue and
+runs the n8n logout logic off the request path.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+from apps.auth.webhook_services import handle_casdoor_logout_webhook
+from conf.enhanced_logging import get_logger
+
+logger = get_logger(__name__)
+
+WEBHOOK_QUEUE_MAXSIZE = 1024
+WEBHOOK_WORKER_COUNT = 8
+# Seconds shutdown waits for queued payloads before dropping them
+WEBHOOK_DRAIN_TIMEOUT = 10.0
+
+queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_MAXSIZE)
+_workers: List[asyncio.Task] = []
+# Cleared once shutdown starts so no new payloads are acknowledged
+_accepting = True
+
+
+def accepting_webhooks() -> bool:
+    """Whether new payloads are accepted (False once shutdown has started)."""
+    return _accepting
+
+
+def enqueue_webhook(payload: Dict[str, Any]) -> bool:
+    """
+    Queue a webhook payload for background processing.
+
+    Returns:
+        True if queued, False if the queue is full
+    """
+    try:
+        queue.put_nowait(payload)
+        return True
+    except asyncio.QueueFull:
+        logger.warning("Webhook queue full, rejecting payload", extra={
+            "webhook_event_id": payload.get("id"),
+            "queue_size": queue.qsize()
+        })
+        return False
+
+
+async def worker(worker_id: int) -> None:
+    """Drain the webhook queue and process each logout payload."""
+    while True:
+        payload = await queue.get()
+        try:
+            result = await handle_casdoor_logout_webhook(payload)
+            logger.info("Webhook processed in background", extra={
+                "worker_id": worker_id,
+                "webhook_event_id": payload.get("id"),
+                "result_status": result.get("status") if isinstance(result, dict) else "unknown",
+                "user_email": result.get("user_email") if isinstance(result, dict) else None
+            })
+        except Exception as exc:
+            # Never let a downstream failure kill the worker
+            logger.critical("Background webhook processing failed", extra={
+                "worker_id": worker_id,
+                "webhook_event_id": payload.get("id"),
+                "error_type": type(exc).__name__,
+                "error_message": str(exc)
+            }, exc_info=exc)
+        finally:
+            queue.task_done()
+
+
+def start_webhook_workers(count: int = WEBHOOK_WORKER_COUNT) -> None:
+    """Start background webhook workers (called on application startup)."""
+    global _accepting
+    _accepting = True
+    if _workers:
+        return
+    for worker_id in range(count):
+        _workers.append(asyncio.create_task(worker(worker_id)))
+    logger.info("Webhook workers started", extra={"worker_count": count})
+
+
+async def stop_webhook_workers(timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+    """
+    Drain the queue, then cancel background webhook workers (called on application shutdown).
+
+    Casdoor has already been acknowledged for every queued payload and will not
+    retry, so queued logouts are processed before the workers stop.
+    """
+    global _accepting
+    _accepting = False
+    if _workers:
+        try:
+            await asyncio.wait_for(queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Webhook queue not drained before shutdown, dropping payloads", extra={
+                "dropped_count": queue.qsize(),
+                "timeout": timeout
+            })
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -1,45 +1,59 @@
 """Casdoor webhook handlers for logout synchronization."""
 from __future__ import annotations
 
+import asyncio
 import logging
 import json
 from typing import Dict, Any
-from fastapi import HTTPException
 
 from apps.integrations.n8n_client import N8NClient
-from apps.integrations.n8n_db import get_user_by_email
 from conf.settings import get_settings
 from conf.enhanced_logging import get_logger
 
 logger = get_logger(__name__)
 
+# In-flight logout tasks, keyed by normalized email, shared by concurrent webhooks
+_inflight_logouts: Dict[str, asyncio.Task] = {}
+
+
+def _email_key(email: str) -> str:
+    return email.strip().lower()
+
 class CasdoorWebhookPayload:
     """Represents a Casdoor webhook payload."""
+    __slots__ = (
+        "id", "owner", "name", "created_time", "organization", "client_ip",
+        "user", "method", "request_uri", "action", "is_triggered", "object",
+        "extended_user",
+    )
+    
     def __init__(self, data: Dict[str, Any]):
-        self.id = data.get("id")
-        self.owner = data.get("owner")
-        self.name = data.get("name")
-        self.created_time = data.get("createdTime")
-        self.organization = data.get("organization")
-        self.client_ip = data.get("clientIp")
-        self.user = data.get("user")
-        self.method = data.get("method")
-        self.request_uri = data.get("requestUri")
-        self.action = data.get("action")
-        self.is_triggered = data.get("isTriggered")
-        self.object = data.get("object")
-        self.extended_user = data.get("extendedUser", {})
+        g = data.get
+        obj = g("object")
+        self.id = g("id")
+        self.owner = g("owner")
+        self.name = g("name")
+        self.created_time = g("createdTime")
+        self.organization = g("organization")
+        self.client_ip = g("clientIp")
+        self.user = g("user")
+        self.method = g("method")
+        self.request_uri = g("requestUri")
+        self.action = g("action")
+        self.is_triggered = g("isTriggered")
+        self.object = obj
+        self.extended_user = g("extendedUser") or {}
         
-        # Also try to get user info from the main payload if extendedUser is empty
-        if not self.extended_user and data.get("object"):
-            # Sometimes the user info is in the "object" field
-            obj = data["object"]
-            if isinstance(obj, dict) and obj.get("email"):
-                self.extended_user = {
-                    "email": obj.get("email"),
-                    "name": obj.get("name"),
-                    "displayName": obj.get("displayName") or obj.get("firstName", "") + " " + obj.get("lastName", "").strip()
-                }
+        # Sometimes the user info is in the "object" field instead of extendedUser
+        if not self.extended_user and isinstance(obj, dict) and obj.get("email"):
+            display_name = obj.get("displayName")
+            if not display_name:
+                display_name = f"{obj.get('firstName') or ''} {obj.get('lastName') or ''}".strip()
+            self.extended_user = {
+                "email": obj["email"],
+                "name": obj.get("name"),
+                "displayName": display_name
+            }
         
     @property
     def user_email(self) -> str | None:
@@ -70,28 +84,31 @@ async def handle_casdoor_logout_webhook(payload: Dict[str, Any]) -> Dict[str, An
     3. Logs them out from n8n
     4. Returns success/failure status
     """
+    # Only handle logout events; check before building the payload object
+    action = payload.get("action")
+    if action != "logout":
+        logger.debug("Ignoring non-logout webhook event", extra={
+            "action": action
+        })
+        return {"status": "ignored", "reason": "not_logout_event"}
+    
     webhook_data = CasdoorWebhookPayload(payload)
     request_id = str(webhook_data.id)[:8] if webhook_data.id else "unknown"
     
-    # Debug: Log the full payload to understand what we're receiving
     logger.info("Received Casdoor webhook", extra={
         "request_id": request_id,
         "action": webhook_data.action,
+        "email": webhook_data.user_email
+    })
+    # Full payload only at debug level, so sinks skip serializing it in production
+    logger.debug("Casdoor webhook payload", extra={
+        "request_id": request_id,
         "user": webhook_data.user_name,
-        "email": webhook_data.user_email,
         "organization": webhook_data.organization,
-        "full_payload": payload,  # Add full payload for debugging
+        "full_payload": payload,
         "extended_user": webhook_data.extended_user
     })
     
-    # Only handle logout events
-    if not webhook_data.is_logout_event():
-        logger.info("Ignoring non-logout webhook event", extra={
-            "request_id": request_id,
-            "action": webhook_data.action
-        })
-        return {"status": "ignored", "reason": "not_logout_event"}
-    
     user_email = webhook_data.user_email
     if not user_email:
         logger.warning("Logout webhook missing user email", extra={
@@ -100,99 +117,70 @@ async def handle_casdoor_logout_webhook(payload: Dict[str, Any]) -> Dict[str, An
         })
         return {"status": "error", "reason": "missing_user_email"}
     
+    key = _email_key(user_email)
+    task = _inflight_logouts.get(key)
+    if task is None:
+        # No await between lookup and insert, so concurrent webhooks can't both start one
+        task = asyncio.create_task(_logout_user_everywhere(user_email, request_id))
+        _inflight_logouts[key] = task
+        task.add_done_callback(lambda _task: _inflight_logouts.pop(key, None))
+    else:
+        logger.info("Joining in-flight logout for user", extra={
+            "request_id": request_id,
+            "email": user_email
+        })
+    
+    # Shield so one cancelled caller doesn't cancel the logout for the others
+    return await asyncio.shield(task)
+
+
+async def _logout_user_everywhere(user_email: str, request_id: str) -> Dict[str, Any]:
+    """Invalidate every n8n session of a user."""
     try:
         settings = get_settings()
         
-        # Try to find the user in n8n database to get their current session info
-        user_row = None
-        try:
-            user_row = await get_user_by_email(user_email)
-            logger.info("Found n8n user for logout", extra={
-                "request_id": request_id,
-                "email": user_email,
-                "user_id": str(user_row.id) if user_row else "not_found"
-            })
-        except Exception as db_exc:
-            logger.warning("Could not find user in n8n database", extra={
-                "request_id": request_id,
-                "email": user_email,
-                "error": str(db_exc)
-            })
-        
-        # Attempt to logout from n8n
+        # Rotates the user's n8n password, which invalidates all their sessions.
+        # The UPDATE matches by email, so an unknown user simply reports failure
+        # and no separate existence lookup is needed
         n8n_client = N8NClient(base_url=str(settings.N8N_BASE_URL))
+        logout_response = await n8n_client.logout_user_by_email(user_email)
         
-        try:
-            # Method 1: Try API-based logout (login as user, then logout)
-            logout_response = n8n_client.logout_user_by_email(user_email)
-            
-            if logout_response.status_code < 400:
-                logger.info("n8n logout API successful via webhook", extra={
-                    "request_id": request_id,
-                    "email": user_email,
-                    "status_code": logout_response.status_code,
-                    "approach": "api_login_logout"
-                })
-                
-                return {
-                    "status": "success",
-                    "user_email": user_email,
-                    "n8n_logout_status": logout_response.status_code,
-                    "method": "api_logout",
-                    "message": "User logged out from n8n via API"
-                }
-            else:
-                # Method 2: Fallback to database approach (password rotation)
-                logger.warning("API logout failed, trying database approach", extra={
-                    "request_id": request_id,
-                    "email": user_email,
-                    "api_status": logout_response.status_code
-                })
-                
-                from apps.integrations.n8n_db import invalidate_user_sessions_db
-                db_success = await invalidate_user_sessions_db(user_email)
-                
-                if db_success:
-                    return {
-                        "status": "success",
-                        "user_email": user_email,
-                        "method": "database_invalidation",
-                        "message": "User sessions invalidated via database (password rotation)"
-                    }
-                else:
-                    return {
-                        "status": "partial_failure",
-                        "user_email": user_email,
-                        "api_status": logout_response.status_code,
-                        "db_status": "failed",
-                        "message": "Both API and database logout methods failed"
-                    }
-            
-        except Exception as logout_exc:
-            logger.error("Failed to logout user from n8n", extra={
+        if logout_response.status_code < 400:
+            logger.info("n8n sessions invalidated via webhook", extra={
                 "request_id": request_id,
                 "email": user_email,
-                "error": str(logout_exc)
+                "approach": "database_invalidation"
             })
-            
             return {
-                "status": "error",
+                "status": "success",
                 "user_email": user_email,
-                "error": str(logout_exc),
-                "message": "Failed to logout from n8n"
+                "method": "database_invalidation",
+                "message": "User sessions invalidated via database (password rotation)"
             }
         
-        finally:
-            n8n_client.close()
+        logger.error("Failed to logout user from n8n", extra={
+            "request_id": request_id,
+            "email": user_email,
+            "status_code": logout_response.status_code
+        })
+        return {
+            "status": "error",
+            "user_email": user_email,
+            "db_status": "failed",
+            "message": "Failed to invalidate n8n sessions"
+        }
             
     except Exception as exc:
+        # Runs in a background worker, so report the failure instead of raising
         logger.critical("Webhook processing failed", extra={
             "request_id": request_id,
             "email": user_email,
             "error": str(exc),
             "error_type": type(exc).__name__
         }, exc_info=exc)
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Webhook processing failed: {str(exc)}"
-        )
+        return {
+            "status": "error",
+            "user_email": user_email,
+            "error": str(exc),
+            "message": "Webhook processing failed"
+        }
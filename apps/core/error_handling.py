@@ -6,9 +6,11 @@ to DEFAULT_REDIRECT_URL instead of crashing the service with unhandled exception
 """
 from __future__ import annotations
 
+import asyncio
 import uuid
-from typing import Optional
-from urllib.parse import urlencode, urlparse, urlunparse, parse_qs
+from functools import lru_cache
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from fastapi.responses import RedirectResponse
 from fastapi import HTTPException
@@ -19,6 +21,27 @@ from conf.enhanced_logging import get_logger
 logger = get_logger(__name__)
 
 
+@lru_cache(maxsize=8)
+def _redirect_parts(base_url: str) -> Tuple[Tuple[str, str, str], Tuple[Tuple[str, str], ...], str]:
+    """Split a redirect URL into its scheme/netloc/path, query pairs (minus flash) and fragment."""
+    parts = urlsplit(base_url)
+    query = tuple(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key != 'flash'
+    )
+    return (parts.scheme, parts.netloc, parts.path), query, parts.fragment
+
+
+def _build_redirect_url(base_url: str, flash_message: Optional[str]) -> str:
+    """Build the redirect URL, adding the flash message to the query when provided."""
+    if not flash_message:
+        return base_url
+    (scheme, netloc, path), query, fragment = _redirect_parts(base_url)
+    query_string = urlencode(query + (('flash', flash_message),))
+    return urlunsplit((scheme, netloc, path, query_string, fragment))
+
+
 def create_safe_redirect(
     error: Exception,
     flash_message: Optional[str] = None,
@@ -41,7 +64,7 @@ def create_safe_redirect(
         RedirectResponse to DEFAULT_REDIRECT_URL with optional flash message
     """
     if not request_id:
-        request_id = str(uuid.uuid4())[:8]
+        request_id = uuid.uuid4().hex[:8]
     
     settings = get_settings()
     
@@ -60,14 +83,7 @@ def create_safe_redirect(
     logger.critical("Critical error handled gracefully with redirect", extra=log_context, exc_info=error)
     
     # Create redirect URL with flash message if provided
-    redirect_url = settings.DEFAULT_REDIRECT_URL
-    
-    if flash_message:
-        url_parts = list(urlparse(redirect_url))
-        query = parse_qs(url_parts[4])
-        query['flash'] = [flash_message]
-        url_parts[4] = urlencode(query, doseq=True)
-        redirect_url = urlunparse(url_parts)
+    redirect_url = _build_redirect_url(settings.DEFAULT_REDIRECT_URL, flash_message)
     
     return RedirectResponse(url=redirect_url, status_code=302)
 
@@ -94,7 +110,7 @@ def log_and_redirect_on_error(
         RedirectResponse to DEFAULT_REDIRECT_URL with optional flash message
     """
     if not request_id:
-        request_id = str(uuid.uuid4())[:8]
+        request_id = uuid.uuid4().hex[:8]
     
     settings = get_settings()
     
@@ -112,14 +128,7 @@ def log_and_redirect_on_error(
     logger.critical("Critical error logged with safe redirect", extra=log_context)
     
     # Create redirect URL with flash message if provided
-    redirect_url = settings.DEFAULT_REDIRECT_URL
-    
-    if flash_message:
-        url_parts = list(urlparse(redirect_url))
-        query = parse_qs(url_parts[4])
-        query['flash'] = [flash_message]
-        url_parts[4] = urlencode(query, doseq=True)
-        redirect_url = urlunparse(url_parts)
+    redirect_url = _build_redirect_url(settings.DEFAULT_REDIRECT_URL, flash_message)
     
     return RedirectResponse(url=redirect_url, status_code=302)
 
@@ -142,7 +151,7 @@ class SafeRedirectHandler:
         flash_message: Optional[str] = None,
         context: Optional[dict] = None
     ):
-        self.request_id = request_id or str(uuid.uuid4())[:8]
+        self.request_id = request_id or uuid.uuid4().hex[:8]
         self.flash_message = flash_message
         self.context = context or {}
         self.result = None
@@ -168,6 +177,16 @@ class SafeRedirectHandler:
         return self.result
 
 
+def _build_ctx(func, operation_name: str, args: tuple, kwargs: dict) -> dict:
+    """Build the logging context for a failed decorated call."""
+    return {
+        "operation": operation_name,
+        "function": func.__name__,
+        "args_count": len(args),
+        "kwargs_keys": list(kwargs.keys())
+    }
+
+
 def safe_operation(
     operation_name: str,
     default_flash_message: str = "An error occurred. Please try again later."
@@ -186,48 +205,31 @@ def safe_operation(
             return result
     """
     def decorator(func):
-        async def async_wrapper(*args, **kwargs):
-            request_id = str(uuid.uuid4())[:8]
-            try:
-                result = await func(*args, **kwargs)
-                return result
-            except Exception as exc:
-                return create_safe_redirect(
-                    error=exc,
-                    flash_message=default_flash_message,
-                    context={
-                        "operation": operation_name,
-                        "function": func.__name__,
-                        "args_count": len(args),
-                        "kwargs_keys": list(kwargs.keys())
-                    },
-                    request_id=request_id
-                )
-        
-        def sync_wrapper(*args, **kwargs):
-            request_id = str(uuid.uuid4())[:8]
-            try:
-                result = func(*args, **kwargs)
-                return result
-            except Exception as exc:
-                return create_safe_redirect(
-                    error=exc,
-                    flash_message=default_flash_message,
-                    context={
-                        "operation": operation_name,
-                        "function": func.__name__,
-                        "args_count": len(args),
-                        "kwargs_keys": list(kwargs.keys())
-                    },
-                    request_id=request_id
-                )
-        
         # Return appropriate wrapper based on function type
-        import asyncio
         if asyncio.iscoroutinefunction(func):
-            return async_wrapper
+            async def wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as exc:
+                    return create_safe_redirect(
+                        error=exc,
+                        flash_message=default_flash_message,
+                        context=_build_ctx(func, operation_name, args, kwargs),
+                        request_id=uuid.uuid4().hex[:8]
+                    )
         else:
-            return sync_wrapper
+            def wrapper(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc:
+                    return create_safe_redirect(
+                        error=exc,
+                        flash_message=default_flash_message,
+                        context=_build_ctx(func, operation_name, args, kwargs),
+                        request_id=uuid.uuid4().hex[:8]
+                    )
+        
+        return wrapper
     
     return decorator
 
@@ -255,53 +257,33 @@ def safe_api_operation(
             return result
     """
     def decorator(func):
-        async def async_wrapper(*args, **kwargs):
-            request_id = str(uuid.uuid4())[:8]
-            try:
-                result = await func(*args, **kwargs)
-                return result
-            except Exception as exc:
-                logger.critical("Critical error in API operation", extra={
-                    "request_id": request_id,
-                    "operation": operation_name,
-                    "function": func.__name__,
-                    "error_type": type(exc).__name__,
-                    "error_message": str(exc),
-                    "args_count": len(args),
-                    "kwargs_keys": list(kwargs.keys())
-                }, exc_info=exc)
-                
-                raise HTTPException(
-                    status_code=default_status_code,
-                    detail=f"{default_detail}: {str(exc)}"
-                )
-        
-        def sync_wrapper(*args, **kwargs):
-            request_id = str(uuid.uuid4())[:8]
-            try:
-                result = func(*args, **kwargs)
-                return result
-            except Exception as exc:
-                logger.critical("Critical error in API operation", extra={
-                    "request_id": request_id,
-                    "operation": operation_name,
-                    "function": func.__name__,
-                    "error_type": type(exc).__name__,
-                    "error_message": str(exc),
-                    "args_count": len(args),
-                    "kwargs_keys": list(kwargs.keys())
-                }, exc_info=exc)
-                
-                raise HTTPException(
-                    status_code=default_status_code,
-                    detail=f"{default_detail}: {str(exc)}"
-                )
+        def to_http_error(exc: Exception, args: tuple, kwargs: dict) -> HTTPException:
+            logger.critical("Critical error in API operation", extra={
+                "request_id": uuid.uuid4().hex[:8],
+                "error_type": type(exc).__name__,
+                "error_message": str(exc),
+                **_build_ctx(func, operation_name, args, kwargs)
+            }, exc_info=exc)
+            
+            return HTTPException(
+                status_code=default_status_code,
+                detail=f"{default_detail}: {str(exc)}"
+            )
         
         # Return appropriate wrapper based on function type
-        import asyncio
         if asyncio.iscoroutinefunction(func):
-            return async_wrapper
+            async def wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as exc:
+                    raise to_http_error(exc, args, kwargs)
         else:
-            return sync_wrapper
+            def wrapper(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc:
+                    raise to_http_error(exc, args, kwargs)
+        
+        return wrapper
     
     return decorator
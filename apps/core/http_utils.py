@@ -0,0 +1,13 @@
+"""Shared helpers for the gateway's outbound HTTP clients."""
+from __future__ import annotations
+
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+
+def no_cookie_jar() -> CookieJar:
+    """Cookie jar that never stores cookies.
+
+    The pooled clients are shared by every user, so cookies from one user's
+    request (such as n8n-auth) must never be replayed on another's.
+    """
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
@@ -1,33 +1,36 @@
 # apps/core/routers/health.py
 
-from fastapi import APIRouter
+import orjson
+from fastapi import APIRouter, Response
 from loguru import logger
 from conf.enhanced_logging import get_logger, monitor_log_health, get_log_stats
+from conf.env import env_bool
 from pathlib import Path
 
 router = APIRouter()
 health_logger = get_logger(__name__)
 
+# Health probes hit these constantly, so serialize the constant bodies once.
+# Docs live under the version mounts unless ENABLE_VERSIONING=0 serves the app flat
+# (read the same way as in apps.main.create_app)
+_VERSIONS = ["/v1/docs", "/latest/docs"] if env_bool("ENABLE_VERSIONING", True) else ["/docs"]
+_WELCOME_BODY = orjson.dumps({
+    "message": "Welcome to n8n SSO Gateway!",
+    "versions": _VERSIONS,
+    "status": "healthy"
+})
+_VERSIONS_BODY = orjson.dumps({
+    "versions": _VERSIONS
+})
+
 @router.get('/')
-def welcome_message():
-    return {
-        "message": "Welcome to n8n SSO Gateway!",
-        "versions": [
-            "/v1/docs",
-            "/v2/docs",
-        ],
-        "status": "healthy"
-    }
+async def welcome_message():
+    return Response(content=_WELCOME_BODY, media_type="application/json")
 
 
 @router.get('/version')
-def last_version():
-    return {
-        "versions": [
-            "/v1/docs",
-            "/v2/docs",
-        ]
-    }
+async def last_version():
+    return Response(content=_VERSIONS_BODY, media_type="application/json")
 
 
 @router.get('/logs')
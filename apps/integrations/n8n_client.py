@@ -3,12 +3,57 @@ from __future__ import annotations
 
 import httpx
 import logging
+import orjson
 from typing import Dict, Any
+from apps.core.http_utils import no_cookie_jar
+from apps.integrations.n8n_db import invalidate_user_sessions_db
 from conf.enhanced_logging import get_logger
 
 logger = get_logger(__name__)
 
 DEFAULT_TIMEOUT = 10.0
+KEEPALIVE_EXPIRY = 75.0
+
+# Shared async client (created once, reused across requests for keep-alive)
+_async_client: httpx.AsyncClient | None = None
+
+def get_n8n_client(base_url: str) -> httpx.AsyncClient:
+    """Get the shared n8n AsyncClient, creating it on first use."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            timeout=DEFAULT_TIMEOUT,
+            # Limits live on the transport once one is passed. Idle connections
+            # are kept for nginx's default 75s keepalive_timeout so login bursts
+            # reuse them; one connect retry covers racing an upstream close
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_keepalive_connections=64,
+                    max_connections=128,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                retries=1,
+            ),
+            cookies=no_cookie_jar(),
+            follow_redirects=False,
+        )
+    return _async_client
+
+async def warm_n8n_client(base_url: str) -> None:
+    """Open a keep-alive connection to n8n up front (called on application startup)."""
+    resp = await get_n8n_client(base_url).get("/healthz")
+    logger.info("n8n HTTP client warmed", extra={"status": resp.status_code})
+
+async def close_n8n_client() -> None:
+    """Close the shared n8n AsyncClient (called on application shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        try:
+            await _async_client.aclose()
+        except Exception:
+            pass
+        _async_client = None
 
 class N8NClientError(RuntimeError):
     def __init__(self, status: int, message: str, payload: Any | None = None):
@@ -17,25 +62,40 @@ class N8NClientError(RuntimeError):
         self.payload = payload
 
 class N8NClient:
+    # Shared, never mutated; copied only when an auth cookie is added
+    _BASE_HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
+
     def __init__(
         self,
         base_url: str,
         timeout: float = DEFAULT_TIMEOUT,
     ):
         self.base_url = base_url.rstrip('/')
-        self._client = httpx.Client(base_url=self.base_url, timeout=timeout, follow_redirects=False)
+        self.timeout = timeout
+        self._client = get_n8n_client(self.base_url)
+
+    async def __aenter__(self) -> "N8NClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        # The pooled AsyncClient is shared across instances and is closed on
+        # application shutdown via close_n8n_client(), not per instance
+        return None
 
-    def _headers(self) -> Dict[str, str]:
-        return {"Accept": "application/json", "Content-Type": "application/json"}
+    def _auth_headers(self, auth_cookie: str | None) -> Dict[str, str]:
+        if not auth_cookie:
+            return self._BASE_HEADERS
+        return {**self._BASE_HEADERS, "Cookie": f"n8n-auth={auth_cookie}"}
 
-    def login_user(self, email: str, password: str) -> httpx.Response:
+    async def login_user(self, email: str, password: str) -> httpx.Response:
         """Login user and return raw response with Set-Cookie headers."""
         payload = {"emailOrLdapLoginId": email, "password": password}
-        resp = self._client.request(
+        resp = await self._client.request(
             "POST", 
             "/rest/login", 
             json=payload, 
-            headers=self._headers()
+            headers=self._BASE_HEADERS,
+            timeout=self.timeout
         )
         
         if resp.status_code >= 400:
@@ -49,34 +109,32 @@ class N8NClient:
         
         logger.info("n8n login successful", extra={
             "email": email, 
-            "status": resp.status_code,
-            "cookies": [cookie for cookie in resp.headers.get_list("set-cookie") or []],
-            "response_text": resp.text[:200],  # First 200 chars of response
-            "all_headers": dict(resp.headers)
+            "status": resp.status_code
         })
         return resp
 
-    def logout_user(self, auth_cookie: str = None) -> httpx.Response:
+    async def logout_user(self, auth_cookie: str = None) -> httpx.Response:
         """Logout user from n8n by calling the logout endpoint."""
-        headers = self._headers()
-        
-        # If we have an auth cookie, include it in the request
-        if auth_cookie:
-            headers["Cookie"] = f"n8n-auth={auth_cookie}"
+        headers = self._auth_headers(auth_cookie)
         
         try:
-            resp = self._client.request(
+            resp = await self._client.request(
                 "POST", 
                 "/rest/logout", 
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
             
             logger.info("n8n logout attempt", extra={
                 "status": resp.status_code,
-                "has_auth_cookie": auth_cookie is not None,
-                "response_text": resp.text[:200] if resp.text else "no response",
-                "response_headers": dict(resp.headers)
+                "has_auth_cookie": auth_cookie is not None
             })
+            if resp.status_code >= 400:
+                logger.warning("n8n logout rejected", extra={
+                    "status": resp.status_code,
+                    "response_text": resp.text[:200] if resp.text else "no response",
+                    "response_headers": dict(resp.headers)
+                })
             
             return resp
             
@@ -87,110 +145,44 @@ class N8NClient:
             })
             raise N8NClientError(500, f"Logout request failed: {exc}")
 
-    def logout_user_by_email(self, user_email: str) -> httpx.Response:
+    async def logout_user_by_email(self, user_email: str) -> httpx.Response:
         """
-        Logout a user by email. Since n8n doesn't have a direct API for this,
-        we'll login as the user first to get a valid session, then logout.
+        Logout a user from every n8n session by email.
+
+        n8n has no API to end another user's sessions, but its auth JWT embeds
+        a hash of the user's password, so rotating the password in the n8n DB
+        invalidates every session in a single UPDATE.
+
+        Returns a synthetic response so callers can keep checking status_code.
         """
-        try:
-            # Import here to avoid circular imports
-            from apps.integrations.n8n_db import get_user_by_email
-            from conf.settings import get_settings
-            import asyncio
-            
-            # Get user info from database
-            async def get_user_password():
-                user_row = await get_user_by_email(user_email)
-                if not user_row:
-                    raise N8NClientError(404, f"User not found: {user_email}")
-                return user_row.password
-            
-            # Get the user's password from the database
-            try:
-                user_password = asyncio.run(get_user_password())
-            except Exception as db_exc:
-                logger.error("Failed to get user password from database", extra={
-                    "user_email": user_email,
-                    "error": str(db_exc)
-                })
-                # Fallback to general logout without specific user authentication
-                return self.logout_user()
-            
-            # Step 1: Login as the user to get a valid session token
-            logger.info("Attempting to login user for logout", extra={
-                "user_email": user_email
-            })
-            
-            try:
-                login_resp = self.login_user(user_email, user_password)
-                
-                # Extract the auth cookie from login response
-                auth_cookie = None
-                if hasattr(login_resp, 'cookies') and login_resp.cookies:
-                    auth_cookie = login_resp.cookies.get('n8n-auth')
-                
-                if not auth_cookie and hasattr(login_resp, 'headers'):
-                    # Try to extract from set-cookie headers
-                    set_cookie_headers = login_resp.headers.get_list('set-cookie') or []
-                    for cookie in set_cookie_headers:
-                        if 'n8n-auth=' in cookie:
-                            auth_cookie = cookie.split('n8n-auth=')[1].split(';')[0]
-                            break
-                
-                logger.info("Login for logout completed", extra={
-                    "user_email": user_email,
-                    "login_status": login_resp.status_code,
-                    "has_auth_cookie": auth_cookie is not None
-                })
-                
-                # Step 2: Now logout using the obtained auth cookie
-                if auth_cookie:
-                    logout_resp = self.logout_user(auth_cookie)
-                    logger.info("User logout with auth cookie completed", extra={
-                        "user_email": user_email,
-                        "logout_status": logout_resp.status_code,
-                        "approach": "login_then_logout"
-                    })
-                    return logout_resp
-                else:
-                    # Fallback: try logout without cookie
-                    logout_resp = self.logout_user()
-                    logger.warning("User logout without auth cookie", extra={
-                        "user_email": user_email,
-                        "logout_status": logout_resp.status_code,
-                        "approach": "fallback_logout"
-                    })
-                    return logout_resp
-                    
-            except Exception as login_exc:
-                logger.error("Login for logout failed", extra={
-                    "user_email": user_email,
-                    "error": str(login_exc)
-                })
-                # Fallback to general logout
-                return self.logout_user()
-            
-        except Exception as exc:
-            logger.error("Logout by email failed", extra={
-                "user_email": user_email,
-                "error": str(exc)
-            })
-            raise N8NClientError(500, f"Logout by email failed: {exc}")
+        invalidated = await invalidate_user_sessions_db(user_email)
+        status_code = 200 if invalidated else 500
+        
+        logger.info("User logout by email completed", extra={
+            "user_email": user_email,
+            "logout_status": status_code,
+            "approach": "database_invalidation"
+        })
+        return httpx.Response(
+            status_code,
+            json={"success": invalidated},
+            request=httpx.Request("POST", f"{self.base_url}/rest/logout"),
+        )
 
-    def import_workflow(self, workflow_data: dict, auth_cookie: str = None) -> httpx.Response:
+    async def import_workflow(self, workflow_data: dict, auth_cookie: str = None) -> httpx.Response:
         """Import a workflow to n8n."""
-        headers = self._headers()
-        
-        # Add authentication cookie if provided
-        if auth_cookie:
-            headers["Cookie"] = f"n8n-auth={auth_cookie}"
+        # Include the auth cookie only when provided
+        headers = self._auth_headers(auth_cookie)
         
         try:
-            resp = self._client.request(
+            # Workflows can be large; orjson encodes them far faster than
+            # httpx's stdlib json (Content-Type is already in the headers)
+            resp = await self._client.request(
                 "POST",
                 "/rest/workflows",
-                json=workflow_data,
-                headers=headers
+                content=orjson.dumps(workflow_data),
+                headers=headers,
+                timeout=self.timeout
             )
             
             if resp.status_code >= 400:
@@ -203,8 +195,7 @@ class N8NClient:
             
             logger.info("n8n workflow import successful", extra={
                 "status": resp.status_code,
-                "workflow_name": workflow_data.get("name", "unknown"),
-                "workflow_id": resp.json().get("id") if resp.status_code < 400 else None
+                "workflow_name": workflow_data.get("name", "unknown")
             })
             return resp
             
@@ -215,19 +206,17 @@ class N8NClient:
             })
             raise N8NClientError(500, f"Workflow import request failed: {exc}")
 
-    def get_workflows(self, auth_cookie: str = None) -> httpx.Response:
+    async def get_workflows(self, auth_cookie: str = None) -> httpx.Response:
         """Get list of workflows from n8n."""
-        headers = self._headers()
-        
-        # Add authentication cookie if provided
-        if auth_cookie:
-            headers["Cookie"] = f"n8n-auth={auth_cookie}"
+        # Include the auth cookie only when provided
+        headers = self._auth_headers(auth_cookie)
         
         try:
-            resp = self._client.request(
+            resp = await self._client.request(
                 "GET",
                 "/rest/workflows",
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
             
             if resp.status_code >= 400:
@@ -244,9 +233,3 @@ class N8NClient:
                 "error": str(exc)
             })
             raise N8NClientError(500, f"Get workflows request failed: {exc}")
-
-    def close(self):
-        try:
-            self._client.close()
-        except Exception:
-            pass
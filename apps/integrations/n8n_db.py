@@ -1,5 +1,8 @@
 """Direct n8n database operations for user/project/relation management."""
 from __future__ import annotations
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Optional, Tuple
@@ -7,36 +10,84 @@ from uuid import UUID, uuid4
 import bcrypt
 import secrets
 import logging
-import json
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection
 from sqlalchemy import text
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
 from conf.settings import get_settings
 from conf.enhanced_logging import get_logger
 
+# Log extras take raw values such as UUIDs; the sinks stringify them only when
+# a record is actually emitted
 logger = get_logger(__name__)
 
 PROJECT_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
 PROJECT_ID_LEN = 16
 
+# Fixed JSON column values written for every new user/workflow
+_EMPTY_OBJ_JSON = "{}"
+_USER_SETTINGS_JSON = '{"userActivated": false}'
+_PERSONALIZATION_JSON = '{"version": "v4"}'
+
 def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
-def hash_password(raw: str) -> str:
-    """Generate bcrypt hash with 10 rounds."""
-    return bcrypt.hashpw(raw.encode(), bcrypt.gensalt(rounds=10)).decode()
+# Session invalidation writes a random token that is never verified. bcrypt
+# hashes always start with "$", so n8n can never match this against a password
+INVALID_PASSWORD_PREFIX = "!invalid:"
+
+def hash_password(raw: str, rounds: int = 10) -> str:
+    """Generate bcrypt hash (10 rounds by default)."""
+    return bcrypt.hashpw(raw.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+# Dedicated pool for bcrypt (its C backend releases the GIL), so hashing bursts
+# cannot starve the default executor that DNS lookups and to_thread share
+_BCRYPT_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="bcrypt")
+
+async def hash_password_async(raw: str, rounds: int = 10) -> str:
+    """Hash on the bcrypt pool so it doesn't block the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_BCRYPT_POOL, hash_password, raw, rounds)
+
+PASSWORD_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*"
+
+@lru_cache(maxsize=8)
+def _byte_tables(alphabet: str) -> Tuple[bytes, bytes]:
+    """bytes.translate table mapping masked bytes onto alphabet, plus the bytes to reject."""
+    mask = (1 << (len(alphabet) - 1).bit_length()) - 1
+    table = bytearray(256)
+    reject = bytearray()
+    for b in range(256):
+        if (b & mask) < len(alphabet):
+            table[b] = ord(alphabet[b & mask])
+        else:
+            reject.append(b)
+    return bytes(table), bytes(reject)
+
+def _random_string(alphabet: str, length: int) -> str:
+    """Uniform random string from batched token_bytes with masked rejection sampling."""
+    table, reject = _byte_tables(alphabet)
+    out = b""
+    while len(out) < length:
+        # Oversampling covers the rejected bytes in one syscall almost always;
+        # translate() drops rejects and maps the rest in C
+        out += secrets.token_bytes(length * 2 + 16).translate(table, reject)
+    return out[:length].decode()
+
+def generate_invalidation_token() -> str:
+    """Random, never-verifiable password value used to end every session."""
+    return INVALID_PASSWORD_PREFIX + secrets.token_urlsafe(32)
 
 def generate_random_password(length: int = 24) -> str:
     """Generate secure random password."""
-    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*"
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
+    return _random_string(PASSWORD_ALPHABET, length)
 
 def gen_project_id() -> str:
     """Generate NanoID-style project ID."""
-    return ''.join(secrets.choice(PROJECT_ID_ALPHABET) for _ in range(PROJECT_ID_LEN))
+    return _random_string(PROJECT_ID_ALPHABET, PROJECT_ID_LEN)
 
-@dataclass
+@dataclass(slots=True)
 class CasdoorProfile:
     email: str
     first_name: Optional[str] = None
@@ -45,12 +96,13 @@ class CasdoorProfile:
     casdoor_id: Optional[str] = None
     avatar_url: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class N8nUserRow:
     id: UUID
     email: str
+    password: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class N8nProjectRow:
     id: str
     name: str
@@ -65,9 +117,150 @@ def get_engine():
         _engine = create_async_engine(
             settings.N8N_DB_DSN,
             echo=False,
+            # Bounded pool so webhook bursts cannot exhaust Postgres max_connections
+            pool_size=settings.N8N_DB_POOL_MIN,
+            max_overflow=max(settings.N8N_DB_POOL_MAX - settings.N8N_DB_POOL_MIN, 0),
+            pool_recycle=settings.N8N_DB_POOL_RECYCLE,
+            pool_timeout=settings.N8N_DB_POOL_TIMEOUT,
+            pool_pre_ping=settings.N8N_DB_POOL_PRE_PING,
+            connect_args={
+                # Short OLTP statements never benefit from JIT, it only adds planning time
+                "server_settings": {"jit": "off"},
+                # Cache prepared statements per pooled connection so the hot
+                # user/project/relation queries are parsed and planned once
+                "statement_cache_size": 1024,
+                "prepared_statement_cache_size": 512,
+            },
         )
     return _engine
 
+# Seconds startup waits for the pool warm-up; connections open on demand after that
+WARM_POOL_TIMEOUT = 5.0
+
+async def warm_pool() -> None:
+    """Open the pool's base connections up front (called on application startup)."""
+    settings = get_settings()
+    engine = get_engine()
+    
+    async def _open():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(_open() for _ in range(settings.N8N_DB_POOL_MIN))),
+            timeout=WARM_POOL_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"n8n DB pool warm-up timed out after {WARM_POOL_TIMEOUT}s") from None
+    logger.info("n8n DB pool warmed", extra={"connections": settings.N8N_DB_POOL_MIN})
+
+async def dispose_engine() -> None:
+    """Close all pooled connections (called on application shutdown)."""
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+# Hot-path statements, built once at import so the bind-parameter parse
+# (and SQLAlchemy's cache-key build) isn't repeated on every call
+_Q_LOCK_EMAIL = text("SELECT pg_advisory_xact_lock(hashtext(:email))")
+
+_Q_BIND_EXISTING_USER = text('''
+    WITH u AS (
+        SELECT id FROM "user" WHERE email = :email
+    ),
+    existing_p AS (
+        SELECT id FROM project WHERE name = :email ORDER BY "createdAt" LIMIT 1
+    ),
+    ins_p AS (
+        INSERT INTO project (id, name, type, "createdAt", "updatedAt")
+        SELECT CAST(:projectId AS varchar), CAST(:email AS varchar), 'personal',
+               CAST(:now AS timestamptz), CAST(:now AS timestamptz)
+        WHERE EXISTS (SELECT 1 FROM u) AND NOT EXISTS (SELECT 1 FROM existing_p)
+        RETURNING id
+    ),
+    p AS (
+        SELECT id FROM existing_p UNION ALL SELECT id FROM ins_p
+    ),
+    rel AS (
+        INSERT INTO project_relation ("projectId", "userId", role, "createdAt", "updatedAt")
+        SELECT p.id, u.id, CAST(:role AS varchar), CAST(:now AS timestamptz), CAST(:now AS timestamptz) FROM p, u
+        ON CONFLICT ("projectId", "userId") DO NOTHING
+    )
+    SELECT u.id AS user_id, p.id AS project_id FROM u, p
+''')
+
+_Q_CREATE_USER = text('''
+    WITH ins_u AS (
+        INSERT INTO "user" (
+            id, email, "firstName", "lastName", password, "roleSlug", disabled, "mfaEnabled",
+            settings, "personalizationAnswers", "createdAt", "updatedAt"
+        ) VALUES (
+            :id, :email, :firstName, :lastName, :password, :roleSlug, :disabled, :mfaEnabled,
+            :settings, :personalizationAnswers, :now, :now
+        )
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    ),
+    existing_p AS (
+        SELECT id FROM project WHERE name = :email ORDER BY "createdAt" LIMIT 1
+    ),
+    ins_p AS (
+        INSERT INTO project (id, name, type, "createdAt", "updatedAt")
+        SELECT CAST(:projectId AS varchar), CAST(:email AS varchar), 'personal',
+               CAST(:now AS timestamptz), CAST(:now AS timestamptz)
+        WHERE EXISTS (SELECT 1 FROM ins_u) AND NOT EXISTS (SELECT 1 FROM existing_p)
+        RETURNING id
+    ),
+    p AS (
+        SELECT id FROM existing_p UNION ALL SELECT id FROM ins_p
+    ),
+    rel AS (
+        INSERT INTO project_relation ("projectId", "userId", role, "createdAt", "updatedAt")
+        SELECT p.id, ins_u.id, CAST(:role AS varchar), CAST(:now AS timestamptz), CAST(:now AS timestamptz) FROM p, ins_u
+        ON CONFLICT ("projectId", "userId") DO NOTHING
+    )
+    SELECT ins_u.id AS user_id, p.id AS project_id FROM ins_u, p
+''')
+
+_Q_ROTATE_PASSWORD = text('UPDATE "user" SET password = :password, "updatedAt" = :updatedAt WHERE id = :id')
+
+_Q_SELECT_USER = text('SELECT id, email, password FROM "user" WHERE email = :email')
+
+_Q_INVALIDATE_SESSIONS = text('UPDATE "user" SET password = :password WHERE email = :email')
+
+_Q_WORKFLOW_COLUMNS = text("""
+    SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name = 'workflow_entity'
+    AND table_schema = 'public'
+""")
+
+_Q_WORKFLOW_RELATION_TABLES = text("""
+    SELECT table_name
+    FROM information_schema.tables
+    WHERE table_name IN ('shared_workflow', 'workflow_entity_relation')
+    AND table_schema = 'public'
+""")
+
+_Q_INSERT_WORKFLOW = text('''
+    INSERT INTO workflow_entity (
+        id, name, active, nodes, connections, settings, "staticData",
+        "pinData", "versionId", "triggerCount", "createdAt", "updatedAt",
+        meta, "isArchived"
+    ) VALUES (
+        :id, :name, :active, :nodes, :connections, :settings, :staticData,
+        :pinData, :versionId, :triggerCount, :createdAt, :updatedAt,
+        :meta, :isArchived
+    )
+''')
+
+_Q_INSERT_SHARED_WORKFLOW = text('''
+    INSERT INTO shared_workflow ("workflowId", "projectId", "role")
+    VALUES (:workflowId, :projectId, :role)
+''')
+
 @asynccontextmanager
 async def get_connection():
     """Get async database connection."""
@@ -75,6 +268,22 @@ async def get_connection():
     async with engine.begin() as conn:
         yield conn
 
+@asynccontextmanager
+async def get_autocommit_connection():
+    """Get autocommit connection for single statements (no BEGIN/COMMIT round-trips)."""
+    engine = get_engine()
+    async with engine.connect() as conn:
+        yield await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+async def _update_password(query, params: dict) -> int:
+    """Run a single password UPDATE and return the number of rows changed.
+    
+    One statement is atomic on its own, so it runs in autocommit mode.
+    """
+    async with get_autocommit_connection() as conn:
+        result = await conn.execute(query, params)
+        return result.rowcount
+
 async def ensure_user_project_binding(
     prof: CasdoorProfile,
     *,
@@ -85,6 +294,9 @@ async def ensure_user_project_binding(
     """
     Upsert user, project, and relation in n8n database.
     
+    Existing users are bound in a single CTE round-trip; new users are inserted
+    together with their project and relation in a second CTE.
+    
     Returns:
         (user_row, project_row, temp_password_if_new_else_None)
     """
@@ -95,41 +307,40 @@ async def ensure_user_project_binding(
     user_exists = False
     
     async with get_connection() as conn:
-        # Set transaction isolation level to SERIALIZABLE
-        await conn.execute(text("SET TRANSACTION ISOLATION LEVEL SERIALIZABLE"))
+        # Serialize bindings for the same email only; project.name has no unique
+        # constraint, so this keeps concurrent logins from creating two projects
+        await conn.execute(_Q_LOCK_EMAIL, {"email": prof.email})
         
-        # 1. Check if user exists
-        user_result = await conn.execute(
-            text('SELECT id, email FROM "user" WHERE email = :email FOR UPDATE'),
-            {"email": prof.email}
-        )
-        user_row = user_result.fetchone()
+        # 1. Existing user: find user and project, create missing project and relation
+        binding = (await conn.execute(
+            _Q_BIND_EXISTING_USER,
+            {
+                "email": prof.email,
+                "projectId": gen_project_id(),
+                "role": project_role,
+                "now": now,
+            }
+        )).fetchone()
         
-        if user_row:
+        if binding:
             user_exists = True
-            user_id = user_row.id
-            logger.info("Found existing user", extra={"email": prof.email, "user_id": str(user_id)})
+            logger.info("Found existing user", extra={
+                "email": prof.email,
+                "user_id": binding.user_id,
+                "project_id": binding.project_id
+            })
         else:
-            # Create new user
-            user_id = uuid4()
+            # 2. New user: insert user, project and relation in one statement
             temp_password = generate_random_password()
-            hashed_password = hash_password(temp_password)
+            hashed_password = await hash_password_async(temp_password)
             
             first_name = prof.first_name or prof.display_name or prof.email.split("@")[0]
             last_name = prof.last_name or ""
             
-            await conn.execute(
-                text('''
-                    INSERT INTO "user" (
-                        id, email, "firstName", "lastName", password, "roleSlug", disabled, "mfaEnabled",
-                        settings, "personalizationAnswers", "createdAt", "updatedAt"
-                    ) VALUES (
-                        :id, :email, :firstName, :lastName, :password, :roleSlug, :disabled, :mfaEnabled,
-                        :settings, :personalizationAnswers, :createdAt, :updatedAt
-                    )
-                '''),
+            binding = (await conn.execute(
+                _Q_CREATE_USER,
                 {
-                    "id": user_id,
+                    "id": uuid4(),
                     "email": prof.email,
                     "firstName": first_name,
                     "lastName": last_name,
@@ -137,60 +348,29 @@ async def ensure_user_project_binding(
                     "roleSlug": global_role,  # Use the global_role parameter here
                     "disabled": False,
                     "mfaEnabled": False,
-                    "settings": '{"userActivated": false}',
-                    "personalizationAnswers": '{"version": "v4"}',
-                    "createdAt": now,
-                    "updatedAt": now,
+                    "settings": _USER_SETTINGS_JSON,
+                    "personalizationAnswers": _PERSONALIZATION_JSON,
+                    "projectId": gen_project_id(),
+                    "role": project_role,
+                    "now": now,
                 }
-            )
-            logger.info("Created new user", extra={"email": prof.email, "user_id": str(user_id)})
-        
-        # 2. Check if project exists
-        project_result = await conn.execute(
-            text('SELECT id, name FROM project WHERE name = :name FOR UPDATE'),
-            {"name": prof.email}
-        )
-        project_row = project_result.fetchone()
-        
-        if project_row:
-            project_id = project_row.id
-            logger.info("Found existing project", extra={"project_name": prof.email, "project_id": project_id})
-        else:
-            # Create new project
-            project_id = gen_project_id()
-            await conn.execute(
-                text('''
-                    INSERT INTO project (id, name, type, "createdAt", "updatedAt")
-                    VALUES (:id, :name, :type, :createdAt, :updatedAt)
-                '''),
-                {
-                    "id": project_id,
-                    "name": prof.email,
-                    "type": "personal",
-                    "createdAt": now,
-                    "updatedAt": now,
-                }
-            )
-            logger.info("Created new project", extra={"project_name": prof.email, "project_id": project_id})
+            )).fetchone()
+            
+            if binding is None:
+                # The user was created outside this gateway between our two statements
+                raise RuntimeError(f"Concurrent user creation for {prof.email}, retry the login")
+            
+            logger.info("Created new user", extra={
+                "email": prof.email,
+                "user_id": binding.user_id,
+                "project_id": binding.project_id
+            })
         
-        # 3. Upsert project relation
-        await conn.execute(
-            text('''
-                INSERT INTO project_relation ("projectId", "userId", role, "createdAt", "updatedAt")
-                VALUES (:projectId, :userId, :role, :createdAt, :updatedAt)
-                ON CONFLICT ("projectId", "userId") DO NOTHING
-            '''),
-            {
-                "projectId": project_id,
-                "userId": user_id,
-                "role": project_role,
-                "createdAt": now,
-                "updatedAt": now,
-            }
-        )
+        user_id = binding.user_id
+        project_id = binding.project_id
         logger.info("Ensured project relation", extra={
             "project_id": project_id,
-            "user_id": str(user_id),
+            "user_id": user_id,
             "role": project_role
         })
         
@@ -207,50 +387,44 @@ async def ensure_user_project_binding(
                 
                 if workflow_created:
                     logger.info("Template workflow created for new user", extra={
-                        "user_id": str(user_id),
+                        "user_id": user_id,
                         "project_id": project_id,
                         "email": prof.email
                     })
                 else:
                     logger.warning("Failed to create template workflow for new user", extra={
-                        "user_id": str(user_id),
+                        "user_id": user_id,
                         "project_id": project_id,
                         "email": prof.email
                     })
             except Exception as template_exc:
                 logger.error("Exception while creating template workflow", extra={
-                    "user_id": str(user_id),
+                    "user_id": user_id,
                     "project_id": project_id,
                     "email": prof.email,
                     "error": str(template_exc)
                 })
                 # Don't fail the entire user creation if template creation fails
         
-        return (
-            N8nUserRow(id=user_id, email=prof.email),
-            N8nProjectRow(id=project_id, name=prof.email),
-            temp_password if not user_exists else None
-        )
+    return (
+        N8nUserRow(id=user_id, email=prof.email),
+        N8nProjectRow(id=project_id, name=prof.email),
+        temp_password if not user_exists else None
+    )
 
 async def rotate_user_password(user_id: UUID, new_password: str) -> None:
     """Rotate password for existing user."""
-    hashed_password = hash_password(new_password)
-    now = now_utc()
+    hashed_password = await hash_password_async(new_password)
     
-    async with get_connection() as conn:
-        await conn.execute(
-            text('UPDATE "user" SET password = :password, "updatedAt" = :updatedAt WHERE id = :id'),
-            {
-                "password": hashed_password,
-                "updatedAt": now,
-                "id": user_id,
-            }
-        )
-        logger.info("Rotated user password", extra={
-            "user_id": str(user_id),
-            "password_length": len(new_password),
-            "hash_prefix": hashed_password[:10]
-        })
+    await _update_password(
+        _Q_ROTATE_PASSWORD,
+        {"password": hashed_password, "updatedAt": now_utc(), "id": user_id}
+    )
+    logger.info("Rotated user password", extra={
+        "user_id": user_id,
+        "password_length": len(new_password),
+        "hash_prefix": hashed_password[:10]
+    })
 
 
 async def get_user_by_email(email: str) -> N8nUserRow | None:
@@ -260,9 +434,10 @@ async def get_user_by_email(email: str) -> N8nUserRow | None:
     Returns:
         N8nUserRow if found, None otherwise
     """
-    async with get_connection() as conn:
+    # A single SELECT needs no transaction, so it runs in autocommit mode
+    async with get_autocommit_connection() as conn:
         user_result = await conn.execute(
-            text('SELECT id, email, password FROM "user" WHERE email = :email'),
+            _Q_SELECT_USER,
             {"email": email}
         )
         user_row = user_result.fetchone()
@@ -270,15 +445,9 @@ async def get_user_by_email(email: str) -> N8nUserRow | None:
         if user_row:
             logger.info("Found user by email", extra={
                 "email": email, 
-                "user_id": str(user_row.id)
+                "user_id": user_row.id
             })
-            # Create a user row object with the password field
-            class UserWithPassword(N8nUserRow):
-                def __init__(self, id, email, password=None):
-                    super().__init__(id, email)
-                    self.password = password
-                    
-            return UserWithPassword(id=user_row.id, email=user_row.email, password=user_row.password)
+            return N8nUserRow(id=user_row.id, email=user_row.email, password=user_row.password)
         
         logger.info("User not found by email", extra={"email": email})
         return None
@@ -293,28 +462,25 @@ async def invalidate_user_sessions_db(user_email: str) -> bool:
         True if successful, False otherwise
     """
     try:
-        async with get_connection() as conn:
-            # Generate a new random password to invalidate all existing sessions
-            new_password = generate_random_password()
-            new_password_hash = hash_password(new_password)
-            
-            # Update the user's password in the database
-            result = await conn.execute(
-                text('UPDATE "user" SET password = :password WHERE email = :email'),
-                {"password": new_password_hash, "email": user_email}
-            )
-            
-            if result.rowcount > 0:
-                logger.info("User sessions invalidated via password rotation", extra={
-                    "user_email": user_email,
-                    "rows_updated": result.rowcount
-                })
-                return True
-            else:
-                logger.warning("No user found to invalidate sessions", extra={
-                    "user_email": user_email
-                })
-                return False
+        # Any change to the stored password invalidates all existing sessions
+        new_password_hash = generate_invalidation_token()
+        
+        rows_updated = await _update_password(
+            _Q_INVALIDATE_SESSIONS,
+            {"password": new_password_hash, "email": user_email}
+        )
+        
+        if rows_updated:
+            logger.info("User sessions invalidated via password rotation", extra={
+                "user_email": user_email,
+                "rows_updated": rows_updated
+            })
+            return True
+        else:
+            logger.warning("No user found to invalidate sessions", extra={
+                "user_email": user_email
+            })
+            return False
                 
     except Exception as exc:
         logger.error("Failed to invalidate user sessions in database", extra={
@@ -357,7 +523,7 @@ async def create_template_workflow_for_user(
         
         if not template:
             logger.warning("No default template available for new user", extra={
-                "user_id": str(user_id),
+                "user_id": user_id,
                 "user_email": user_email
             })
             return False
@@ -368,7 +534,7 @@ async def create_template_workflow_for_user(
         if not workflow_data:
             logger.error("Template data is empty after preparation", extra={
                 "template_name": template.name,
-                "user_id": str(user_id),
+                "user_id": user_id,
                 "user_email": user_email
             })
             return False
@@ -383,8 +549,19 @@ async def create_template_workflow_for_user(
             )
         
         if conn is not None:
-            # Use existing connection (no nested transaction)
-            return await _create_workflow(conn)
+            # Share the caller's connection and transaction, inside a savepoint
+            # so a failed template insert can't abort the user/project binding
+            savepoint = await conn.begin_nested()
+            try:
+                created = await _create_workflow(conn)
+            except Exception:
+                await savepoint.rollback()
+                raise
+            if created:
+                await savepoint.commit()
+            else:
+                await savepoint.rollback()
+            return created
         else:
             # Create new connection and transaction
             async with get_connection() as new_conn:
@@ -392,7 +569,7 @@ async def create_template_workflow_for_user(
                 
     except Exception as exc:
         logger.error("Failed to create template workflow for user", extra={
-            "user_id": str(user_id),
+            "user_id": user_id,
             "project_id": project_id,
             "user_email": user_email,
             "error": str(exc)
@@ -400,83 +577,78 @@ async def create_template_workflow_for_user(
         return False
 
 
+# n8n's workflow tables don't change while the gateway runs, so the
+# information_schema probes run once per process. No lock: a concurrent first
+# signup just repeats the same read-only queries.
+_workflow_schema: Tuple[list[str], list[str]] | None = None
+
+async def _get_workflow_schema(conn) -> Tuple[list[str], list[str]]:
+    """Return (workflow_entity columns, available workflow relation tables)."""
+    global _workflow_schema
+    if _workflow_schema is not None:
+        return _workflow_schema
+    
+    workflow_columns_result = await conn.execute(_Q_WORKFLOW_COLUMNS)
+    workflow_columns = [row[0] for row in workflow_columns_result.fetchall()]
+    
+    # Check if shared_workflow table exists
+    relation_table_result = await conn.execute(_Q_WORKFLOW_RELATION_TABLES)
+    relation_tables = [row[0] for row in relation_table_result.fetchall()]
+    
+    if workflow_columns:
+        # Don't pin a missing table; n8n may still be running its migrations
+        _workflow_schema = (workflow_columns, relation_tables)
+    return workflow_columns, relation_tables
+
+
 async def _create_template_workflow_internal(
     conn, user_id: UUID, project_id: str, user_email: str, 
     workflow_id: str, workflow_data: dict, template, now: datetime
 ) -> bool:
     """Internal function to create template workflow using existing connection."""
-    import json
     from uuid import uuid4
     
     # First check if workflow_entity table exists and get its structure
     try:
-        workflow_columns_result = await conn.execute(
-            text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = 'workflow_entity' 
-                AND table_schema = 'public'
-            """)
-        )
-        workflow_columns = [row[0] for row in workflow_columns_result.fetchall()]
-        
-        # Check if shared_workflow table exists
-        relation_table_result = await conn.execute(
-            text("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_name IN ('shared_workflow', 'workflow_entity_relation') 
-                AND table_schema = 'public'
-            """)
-        )
-        relation_tables = [row[0] for row in relation_table_result.fetchall()]
-        
+        workflow_columns, relation_tables = await _get_workflow_schema(conn)
     except Exception as schema_exc:
         logger.error("Failed to check workflow table schema", extra={
-            "user_id": str(user_id),
+            "user_id": user_id,
             "error": str(schema_exc)
         })
         return False
     
     if not workflow_columns:
         logger.error("workflow_entity table not found", extra={
-            "user_id": str(user_id),
+            "user_id": user_id,
             "user_email": user_email
         })
         return False
     
-    # Prepare workflow data for workflow_entity table
+    # Prepare workflow data for workflow_entity table; the JSON columns are
+    # the same for every user and encoded once per template
+    template_json = template.prepared_json()
     workflow_params = {
         "id": workflow_id,
         "name": workflow_data.get("name", "Template Workflow"),
         "active": False,  # Start inactive
-        "nodes": json.dumps(workflow_data.get("nodes", [])),
-        "connections": json.dumps(workflow_data.get("connections", {})),
-        "settings": json.dumps(workflow_data.get("settings", {})),
-        "staticData": json.dumps({}),
-        "pinData": json.dumps(workflow_data.get("pinData", {})),
+        "nodes": template_json["nodes"],
+        "connections": template_json["connections"],
+        "settings": template_json["settings"],
+        "staticData": _EMPTY_OBJ_JSON,
+        "pinData": template_json["pinData"],
         "versionId": str(uuid4()),
         "triggerCount": 0,
         "createdAt": now,
         "updatedAt": now,
-        "meta": json.dumps({}),
+        "meta": _EMPTY_OBJ_JSON,
         "isArchived": False
     }
     
     # Insert the workflow into workflow_entity
     try:
         await conn.execute(
-            text('''
-                INSERT INTO workflow_entity (
-                    id, name, active, nodes, connections, settings, "staticData",
-                    "pinData", "versionId", "triggerCount", "createdAt", "updatedAt",
-                    meta, "isArchived"
-                ) VALUES (
-                    :id, :name, :active, :nodes, :connections, :settings, :staticData,
-                    :pinData, :versionId, :triggerCount, :createdAt, :updatedAt,
-                    :meta, :isArchived
-                )
-            '''),
+            _Q_INSERT_WORKFLOW,
             workflow_params
         )
         
@@ -501,42 +673,29 @@ async def _create_template_workflow_internal(
     # Make this non-critical so workflow creation doesn't fail if sharing fails
     if "shared_workflow" in relation_tables:
         try:
-            # Check if workflow is already shared first
-            existing_result = await conn.execute(
-                text('SELECT * FROM shared_workflow WHERE "workflowId" = :workflowId'),
-                {"workflowId": workflow_id}
-            )
-            existing_rows = existing_result.fetchall()
-            
-            if existing_rows:
-                logger.warning("Workflow sharing already exists", extra={
-                    "workflow_id": workflow_id,
-                    "existing_sharing_count": len(existing_rows)
-                })
-            else:
+            # The workflow ID was generated above, so it can't be shared yet.
+            # The savepoint keeps a failed share from aborting the transaction.
+            async with conn.begin_nested():
                 # Use simplified insert (let database handle timestamps)
                 await conn.execute(
-                    text('''
-                        INSERT INTO shared_workflow ("workflowId", "projectId", "role") 
-                        VALUES (:workflowId, :projectId, :role)
-                    '''),
+                    _Q_INSERT_SHARED_WORKFLOW,
                     {
                         "workflowId": workflow_id,
                         "projectId": project_id,
                         "role": "workflow:owner"
                     }
                 )
-                
-                logger.info("Workflow shared with project successfully", extra={
-                    "workflow_id": workflow_id,
-                    "project_id": project_id,
-                    "user_email": user_email,
-                    "method": "simplified_insert"
-                })
+            
+            logger.info("Workflow shared with project successfully", extra={
+                "workflow_id": workflow_id,
+                "project_id": project_id,
+                "user_email": user_email,
+                "method": "simplified_insert"
+            })
                 
         except Exception as share_exc:
             logger.error("Failed to share workflow with project (non-critical)", extra={
-                "user_id": str(user_id),
+                "user_id": user_id,
                 "workflow_id": workflow_id,
                 "project_id": project_id,
                 "user_email": user_email,
@@ -555,13 +714,13 @@ async def _create_template_workflow_internal(
             })
     else:
         logger.warning("shared_workflow table not found, workflow created without project association", extra={
-            "user_id": str(user_id),
+            "user_id": user_id,
             "workflow_id": workflow_id,
             "project_id": project_id
         })
     
     logger.info("Template workflow created for user", extra={
-        "user_id": str(user_id),
+        "user_id": user_id,
         "project_id": project_id,
         "workflow_id": workflow_id,
         "workflow_name": workflow_params.get("name"),
@@ -1,8 +1,9 @@
 """Template workflow management utilities."""
 from __future__ import annotations
 
-import json
+import copy
 import os
+import orjson
 import logging
 from typing import Dict, Any, List
 from pathlib import Path
@@ -16,11 +17,15 @@ TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
 class WorkflowTemplate:
     """Represents a workflow template."""
     
-    def __init__(self, name: str, file_path: str, description: str = ""):
+    def __init__(self, name: str, file_path: str, description: str = "", data: Dict[str, Any] | None = None):
         self.name = name
         self.file_path = file_path
         self.description = description
-        self._data = None
+        self._data = data
+        # Sanitized workflow (built at load time) and its JSON columns; both
+        # are identical for every user and reused for each signup
+        self._prepared = self._sanitize(data) if data is not None else None
+        self._prepared_json = None
     
     @property
     def data(self) -> Dict[str, Any]:
@@ -29,11 +34,18 @@ class WorkflowTemplate:
             self._load_template()
         return self._data
     
+    @property
+    def prepared(self) -> Dict[str, Any]:
+        """Load and return the sanitized template data."""
+        if self._prepared is None:
+            self._load_template()
+        return self._prepared
+    
     def _load_template(self) -> None:
         """Load template from file."""
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                self._data = json.load(f)
+            with open(self.file_path, 'rb') as f:
+                self._data = orjson.loads(f.read())
             logger.debug("Template loaded successfully", extra={
                 "template_name": self.name,
                 "file_path": self.file_path
@@ -45,13 +57,42 @@ class WorkflowTemplate:
                 "error": str(exc)
             })
             self._data = {}
+        
+        self._prepared = self._sanitize(self._data)
+        self._prepared_json = None
     
     def prepare_for_user(self, user_email: str) -> Dict[str, Any]:
         """
         Prepare template workflow data for a specific user.
         This removes user-specific credentials and configurations.
         """
-        workflow_data = self.data.copy()
+        workflow_data = copy.deepcopy(self.prepared)
+        
+        logger.info("Template prepared for user", extra={
+            "template_name": self.name,
+            "user_email": user_email,
+            "workflow_name": workflow_data["name"]
+        })
+        
+        return workflow_data
+    
+    def prepared_json(self) -> Dict[str, str]:
+        """JSON-encoded nodes/connections/settings/pinData of the prepared workflow."""
+        if self._prepared_json is None:
+            prepared = self.prepared
+            self._prepared_json = {
+                "nodes": orjson.dumps(prepared.get("nodes", [])).decode(),
+                "connections": orjson.dumps(prepared.get("connections", {})).decode(),
+                "settings": orjson.dumps(prepared.get("settings", {})).decode(),
+                "pinData": orjson.dumps(prepared.get("pinData", {})).decode(),
+            }
+        return self._prepared_json
+    
+    @staticmethod
+    def _sanitize(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Strip credentials and user-specific configuration from the template."""
+        # Deep copy so the loaded template itself is never mutated
+        workflow_data = copy.deepcopy(data)
         
         # Remove specific credentials and user-specific data
         if "nodes" in workflow_data:
@@ -90,12 +131,6 @@ class WorkflowTemplate:
         original_name = workflow_data.get("name", "Workflow")
         workflow_data["name"] = f"{original_name} (Template)"
         
-        logger.info("Template prepared for user", extra={
-            "template_name": self.name,
-            "user_email": user_email,
-            "workflow_name": workflow_data["name"]
-        })
-        
         return workflow_data
 
 
@@ -117,12 +152,14 @@ class TemplateManager:
         for file_path in TEMPLATES_DIR.glob("*.json"):
             try:
                 template_name = file_path.stem
-                description = self._extract_description(file_path)
+                data = self._read_template_file(file_path)
                 
+                # Hand the parsed data over so the file isn't read a second time
                 template = WorkflowTemplate(
                     name=template_name,
                     file_path=str(file_path),
-                    description=description
+                    description=data.get("name", template_name) if data is not None else template_name,
+                    data=data
                 )
                 
                 self.templates[template_name] = template
@@ -138,14 +175,14 @@ class TemplateManager:
                     "error": str(exc)
                 })
     
-    def _extract_description(self, file_path: Path) -> str:
-        """Extract description from template file."""
+    def _read_template_file(self, file_path: Path) -> Dict[str, Any] | None:
+        """Parse a template file; None if unreadable (loaded lazily, and logged, on use)."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get("name", file_path.stem)
+            with open(file_path, 'rb') as f:
+                data = orjson.loads(f.read())
+            return data if isinstance(data, dict) else None
         except Exception:
-            return file_path.stem
+            return None
     
     def get_template(self, name: str) -> WorkflowTemplate | None:
         """Get a template by name."""
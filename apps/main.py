@@ -1,55 +1,44 @@
 # apps/main.py
 
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi_pagination import add_pagination
-from fastapi_versioning import VersionedFastAPI
 
 from apps.auth.routers import router as casdoor_auth_router
 from apps.auth.cookie_bridge import router as cookie_bridge_router
 from apps.core.routers.health import router as health_router
 from apps.metrics import metrics_router, setup_metrics
-from apps.metrics.middleware import PrometheusMetricsMiddleware, MetricsContextMiddleware
+from apps.metrics.middleware import CombinedMetricsMiddleware
+from apps.auth.services import close_casdoor_client
+from apps.auth.webhook_queue import start_webhook_workers, stop_webhook_workers
+from apps.integrations.n8n_client import close_n8n_client, warm_n8n_client
+from apps.integrations.n8n_db import warm_pool, dispose_engine
 from conf.enhanced_logging import configure_enhanced_logging, get_logger
+from conf.env import env_bool
+from conf.settings import get_settings
 
 # Initialize enhanced logging
 log_level = os.getenv("LOG_LEVEL", "INFO")
-enable_file_logging = os.getenv("ENABLE_FILE_LOGGING", "true").lower() in ("true", "1", "yes")
+enable_file_logging = env_bool("ENABLE_FILE_LOGGING", True)
 configure_enhanced_logging(log_level=log_level, enable_file_logging=enable_file_logging)
 
 # Get logger instance
 logger = get_logger(__name__)
 
-app = FastAPI(
-    title="N8N SSO Gateway",
-    description="SSO Gateway for N8N using Casdoor integration",
-    version="v1.0.0",
-)
-
-# Add metrics middleware (must be added before other middleware)
-app.add_middleware(PrometheusMetricsMiddleware, app_name="n8n-sso-gateway")
-app.add_middleware(MetricsContextMiddleware)
-
-# Include the n8n_auth endpoints with a prefix and tag
-app.include_router(health_router, tags=["Health"])
-app.include_router(metrics_router, tags=["Monitoring"])
-app.include_router(casdoor_auth_router)
-app.include_router(cookie_bridge_router)
+APP_TITLE = "N8N SSO Gateway"
+APP_DESCRIPTION = "SSO Gateway for N8N using Casdoor integration"
+# Seconds startup waits for the n8n warm-up request; n8n being down must not hold readiness
+N8N_WARM_TIMEOUT = 3.0
 
-# Add any middleware, exception handlers, etc. here
-add_pagination(app)
-
-# API Versioning: endpoints will be available under /v1, /v2, etc.
-app = VersionedFastAPI(app,
-                       version_format="{major}",
-                       prefix_format="/v{major}",
-                       enable_latest=True,
-                       default_version=(1, 0))
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize application on startup."""
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the application on startup and clean up on shutdown."""
     try:
         # Setup Prometheus metrics
         setup_metrics()
@@ -57,8 +46,114 @@ async def startup_event():
     except Exception as exc:
         logger.error(f"Failed to initialize metrics system: {exc}")
         # Don't fail startup for metrics issues
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on application shutdown."""
+    
+    # Warm the n8n DB pool and the n8n HTTP client concurrently; they are
+    # independent, so startup waits for the slower one instead of both
+    n8n_base_url = str(get_settings().N8N_BASE_URL)
+    pool_result, client_result = await asyncio.gather(
+        # Open n8n DB connections before the first request needs them
+        warm_pool(),
+        # Resolve DNS and complete the TCP/TLS handshake to n8n before the first login
+        asyncio.wait_for(warm_n8n_client(n8n_base_url), timeout=N8N_WARM_TIMEOUT),
+        return_exceptions=True,
+    )
+    if isinstance(pool_result, Exception):
+        logger.error(f"Failed to warm n8n DB pool: {pool_result}")
+        # Connections will be opened on demand instead
+    if isinstance(client_result, Exception):
+        logger.error(f"Failed to warm n8n HTTP client: {client_result!r}")
+        # The connection will be opened on the first request instead
+    
+    # Start background workers that drain the Casdoor webhook queue
+    start_webhook_workers()
+    
+    yield
+    
     logger.info("Application shutting down")
+    
+    await stop_webhook_workers()
+    
+    # Release pooled keep-alive connections to n8n
+    await close_n8n_client()
+    await close_casdoor_client()
+    
+    # Close pooled n8n DB connections
+    await dispose_engine()
+
+
+# Routers served by API v1, with their OpenAPI tags (None keeps the router's own)
+V1_ROUTERS = [
+    (health_router, ["Health"]),
+    (metrics_router, ["Monitoring"]),
+    (casdoor_auth_router, None),
+    (cookie_bridge_router, None),
+]
+
+
+@lru_cache(maxsize=1)
+def create_app() -> FastAPI:
+    """Build the gateway app once; later calls (e.g. from tests) reuse it."""
+    app = FastAPI(
+        title=APP_TITLE,
+        description=APP_DESCRIPTION,
+        version="v1.0.0",
+        default_response_class=ORJSONResponse,
+        # Startup/shutdown run once here; Starlette does not run lifespans of mounted apps
+        lifespan=lifespan,
+    )
+    
+    # API Versioning: endpoints are available under /v1 and /latest. The version
+    # app is mounted directly instead of rebuilt by VersionedFastAPI, which also
+    # dropped middleware registered on the wrapped app. With ENABLE_VERSIONING=0
+    # the endpoints are served at / on the app itself, skipping the Mount.
+    versioned = env_bool("ENABLE_VERSIONING", True)
+    if versioned:
+        # Version 1 of the API; every endpoint currently lives here
+        api = FastAPI(
+            title=APP_TITLE,
+            description=APP_DESCRIPTION,
+            version="1",
+            default_response_class=ORJSONResponse,
+        )
+    else:
+        api = app
+    
+    # Include the n8n_auth endpoints with a prefix and tag
+    for router, tags in V1_ROUTERS:
+        api.include_router(router, tags=tags)
+    
+    # Add any exception handlers, etc. here
+    add_pagination(api)
+    
+    # Add metrics middleware (must be added before other middleware). It lives on
+    # the outer app so it sees the full /v1/... path of every request.
+    app.add_middleware(CombinedMetricsMiddleware, app_name="n8n-sso-gateway")
+    
+    # Opt-in request profiling (PROFILING=1, then add ?profile=1 to a request).
+    # pyinstrument is a dev dependency and is only imported when enabled.
+    if env_bool("PROFILING", False):
+        from fastapi import Request
+        from fastapi.responses import HTMLResponse
+        from pyinstrument import Profiler
+        
+        @app.middleware("http")
+        async def profile_request(request: Request, call_next):
+            if not request.query_params.get("profile"):
+                return await call_next(request)
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            await call_next(request)
+            profiler.stop()
+            return HTMLResponse(profiler.output_html())
+        
+        logger.warning("Request profiling enabled (PROFILING=1); do not use in production")
+    
+    if versioned:
+        app.mount("/v1", api)
+        app.mount("/latest", api)
+    
+    return app
+
+
+# ASGI entry point (uvicorn apps.main:app)
+app = create_app()
@@ -9,15 +9,20 @@ This middleware automatically collects metrics for all HTTP requests including:
 
 The middleware integrates seamlessly with FastAPI and provides comprehensive
 request-level metrics collection without requiring manual instrumentation.
+
+Request context and Prometheus metrics are handled by a single plain ASGI
+layer, CombinedMetricsMiddleware, added as the outermost user middleware.
+It is not a BaseHTTPMiddleware subclass, so a request does not pay for an
+extra task and memory stream pair, and only one frame wraps each request.
 """
 
 import time
+import uuid
 import logging
-from typing import Callable, Dict, Any
-from fastapi import Request, Response
+from typing import Dict, Any
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from .base import (
     record_request_metrics,
@@ -28,15 +33,18 @@ from .base import (
 
 logger = logging.getLogger(__name__)
 
-class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
+class CombinedMetricsMiddleware:
     """
-    FastAPI middleware for automatic Prometheus metrics collection.
+    ASGI middleware for automatic Prometheus metrics collection.
     
     This middleware automatically tracks:
     - HTTP request counts and durations
     - Status code distribution
     - Error rates and types
     - API version usage
+    
+    It also attaches the metrics context (user, correlation ID, client IP)
+    to request.state and echoes the correlation ID as X-Request-ID.
     """
     
     def __init__(self, app: ASGIApp, app_name: str = "n8n-sso-gateway"):
@@ -47,54 +55,62 @@ class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
             app: The ASGI application
             app_name: Name of the application for metrics labeling
         """
-        super().__init__(app)
+        self.app = app
         self.app_name = app_name
         
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
-        Process the request and collect metrics.
+        Add metrics context to the request, process it and collect metrics.
         
         Args:
-            request: The incoming HTTP request
-            call_next: Function to call the next middleware/endpoint
-            
-        Returns:
-            Response: The HTTP response
+            scope: The ASGI connection scope
+            receive: The ASGI receive channel
+            send: The ASGI send channel
         """
-        start_time = time.time()
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
         
         # Extract request information
-        method = request.method
-        endpoint = self._get_endpoint_path(request)
-        version = self._extract_api_version(request)
+        method = scope["method"]
+        path = scope["path"]
+        endpoint = self._get_endpoint_path(path)
+        version = self._extract_api_version(path)
+        
+        headers = Headers(scope=scope)
+        
+        # Add metrics context to request state (exposed as request.state)
+        metrics_context = {
+            'start_time': time.time(),
+            'user_id': self._extract_user_id(headers),
+            'correlation_id': self._extract_correlation_id(headers),
+            'client_ip': self._get_client_ip(scope, headers),
+            'user_agent': headers.get('user-agent', 'unknown')
+        }
+        scope.setdefault("state", {})["metrics_context"] = metrics_context
+        
+        # Status code of the response, captured as it is sent
+        response_started = False
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started, status_code
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                # Add metrics headers to response
+                MutableHeaders(scope=message)['X-Request-ID'] = metrics_context['correlation_id']
+            await send(message)
         
         try:
             # Process the request
-            response = await call_next(request)
-            
-            # Calculate request duration
-            duration = time.time() - start_time
-            
-            # Record successful request metrics
-            record_request_metrics(
-                method=method,
-                endpoint=endpoint,
-                status_code=response.status_code,
-                duration=duration,
-                version=version
-            )
-            
-            # Log request completion
-            logger.debug(
-                f"Request completed: {method} {endpoint} - {response.status_code} "
-                f"({duration:.4f}s)"
-            )
-            
-            return response
+            await self.app(scope, receive, send_wrapper)
             
         except Exception as exc:
             # Calculate duration even for failed requests
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             
             # Record error metrics
             error_type = self._classify_error(exc)
@@ -120,8 +136,12 @@ class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
                 exc_info=True
             )
             
+            # A response that is already on the wire cannot be replaced
+            if response_started:
+                raise
+            
             # Return error response
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=500,
                 content={
                     "error": "Internal server error",
@@ -129,19 +149,37 @@ class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
                     "error_type": error_type
                 }
             )
+            await response(scope, receive, send_wrapper)
+            return
+        
+        # Calculate request duration
+        duration = time.perf_counter() - start_time
+        
+        # Record successful request metrics
+        record_request_metrics(
+            method=method,
+            endpoint=endpoint,
+            status_code=status_code,
+            duration=duration,
+            version=version
+        )
+        
+        # Log request completion
+        logger.debug(
+            f"Request completed: {method} {endpoint} - {status_code} "
+            f"({duration:.4f}s)"
+        )
     
-    def _get_endpoint_path(self, request: Request) -> str:
+    def _get_endpoint_path(self, path: str) -> str:
         """
         Extract the endpoint path for metrics labeling.
         
         Args:
-            request: The HTTP request
+            path: The request path
             
         Returns:
             str: Normalized endpoint path
         """
-        path = request.url.path
-        
         # Normalize path for metrics (remove version prefix if present)
         if path.startswith('/v'):
             # Remove version prefix for consistent metrics
@@ -157,18 +195,16 @@ class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
         
         return path
     
-    def _extract_api_version(self, request: Request) -> str:
+    def _extract_api_version(self, path: str) -> str:
         """
         Extract API version from the request path.
         
         Args:
-            request: The HTTP request
+            path: The request path
             
         Returns:
             str: API version (default: v1)
         """
-        path = request.url.path
-        
         # Extract version from path like /v1/auth/login
         if path.startswith('/v') and len(path) > 2:
             version_part = path[1:3]  # Extract 'v1', 'v2', etc.
@@ -254,63 +290,24 @@ class PrometheusMetricsMiddleware(BaseHTTPMiddleware):
             return 'medium'
         else:
             return 'low'
-
-class MetricsContextMiddleware(BaseHTTPMiddleware):
-    """
-    Additional middleware for context-aware metrics collection.
-    
-    This middleware provides additional context for metrics collection
-    such as user identification, request correlation, and custom labels.
-    """
-    
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Add metrics context to the request.
-        
-        Args:
-            request: The HTTP request
-            call_next: Function to call the next middleware/endpoint
-            
-        Returns:
-            Response: The HTTP response
-        """
-        # Add metrics context to request state
-        request.state.metrics_context = {
-            'start_time': time.time(),
-            'user_id': self._extract_user_id(request),
-            'correlation_id': self._extract_correlation_id(request),
-            'client_ip': self._get_client_ip(request),
-            'user_agent': request.headers.get('user-agent', 'unknown')
-        }
-        
-        response = await call_next(request)
-        
-        # Add metrics headers to response
-        if hasattr(request.state, 'metrics_context'):
-            response.headers['X-Request-ID'] = request.state.metrics_context['correlation_id']
-        
-        return response
     
-    def _extract_user_id(self, request: Request) -> str:
+    def _extract_user_id(self, headers: Headers) -> str:
         """
         Extract user ID from request headers or JWT token.
         
         Args:
-            request: The HTTP request
+            headers: The HTTP request headers
             
         Returns:
             str: User ID or 'anonymous'
         """
         # Check for user ID in headers
-        user_id = request.headers.get('X-User-ID')
+        user_id = headers.get('X-User-ID')
         if user_id:
             return user_id
         
         # Check for authorization header
-        auth_header = request.headers.get('authorization')
+        auth_header = headers.get('authorization')
         if auth_header and auth_header.startswith('Bearer '):
             # In a real implementation, you would decode the JWT here
             # For now, return a placeholder
@@ -318,44 +315,45 @@ class MetricsContextMiddleware(BaseHTTPMiddleware):
         
         return 'anonymous'
     
-    def _extract_correlation_id(self, request: Request) -> str:
+    def _extract_correlation_id(self, headers: Headers) -> str:
         """
         Extract or generate correlation ID for request tracking.
         
         Args:
-            request: The HTTP request
+            headers: The HTTP request headers
             
         Returns:
             str: Correlation ID
         """
         # Check for existing correlation ID
-        correlation_id = request.headers.get('X-Correlation-ID')
+        correlation_id = headers.get('X-Correlation-ID')
         if correlation_id:
             return correlation_id
         
         # Generate new correlation ID
-        import uuid
         return str(uuid.uuid4())
     
-    def _get_client_ip(self, request: Request) -> str:
+    def _get_client_ip(self, scope: Scope, headers: Headers) -> str:
         """
         Get the client IP address from request headers.
         
         Args:
-            request: The HTTP request
+            scope: The ASGI connection scope
+            headers: The HTTP request headers
             
         Returns:
             str: Client IP address
         """
         # Check for forwarded headers (common in proxy setups)
-        forwarded_for = request.headers.get('X-Forwarded-For')
+        forwarded_for = headers.get('X-Forwarded-For')
         if forwarded_for:
             return forwarded_for.split(',')[0].strip()
         
         # Check for real IP header
-        real_ip = request.headers.get('X-Real-IP')
+        real_ip = headers.get('X-Real-IP')
         if real_ip:
             return real_ip
         
         # Fall back to client host
-        return str(request.client.host) if request.client else 'unknown'
+        client = scope.get("client")
+        return str(client[0]) if client else 'unknown'
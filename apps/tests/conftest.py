@@ -0,0 +1,8 @@
+"""Shared pytest setup for the gateway test suite."""
+import sys
+from pathlib import Path
+
+# Make the project root importable (apps/, conf/) wherever pytest is run from
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
@@ -6,28 +6,91 @@ Executes all test suites and provides detailed reporting on coverage and results
 This script runs all the mock unit tests that cover the complete project specifications.
 """
 
+import importlib
+import io
+import json
+import os
 import sys
 import asyncio
+import inspect
 import subprocess
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
 from pathlib import Path
 
-# Add project root to path
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
+# Add project root to path so the suites can import apps/conf
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
 
-# Import all test modules
-try:
-    from test_n8n_db_operations import run_all_tests as run_db_tests
-    from test_n8n_client import run_all_tests as run_client_tests
-    from test_auth_services import run_all_tests as run_auth_services_tests
-    from test_auth_routers import run_all_tests as run_auth_routers_tests
-    from test_core_error_handling import run_all_tests as run_error_handling_tests
-    from test_settings_config import run_all_tests as run_settings_tests
-    from test_integration_end_to_end import run_all_tests as run_integration_tests
-except ImportError as e:
-    print(f"❌ Failed to import test modules: {e}")
-    print("Make sure all test files are in the same directory as this runner.")
-    sys.exit(1)
+from conf.env import env_bool
+
+# Per-suite duration/outcome from previous runs, used to schedule slow suites first
+HISTORY_FILE = PROJECT_ROOT / ".test_history.json"
+
+# Worker-process event loop shared by every async suite that worker runs
+_worker_runner = None
+
+
+def _suite_result(name: str, description: str, suite_start: int, success: bool = False, exc: Exception | None = None):
+    """Build a suite's result entry and print its outcome."""
+    duration = (time.perf_counter_ns() - suite_start) / 1e9
+    
+    result = {
+        'success': success,
+        'duration': duration,
+        'description': description
+    }
+    
+    if exc is not None:
+        result['error'] = str(exc)
+        print(f"\n💥 {name} crashed after {duration:.2f}s: {exc}")
+    elif success:
+        print(f"\n✅ {name} completed successfully in {duration:.2f}s")
+    else:
+        print(f"\n❌ {name} failed after {duration:.2f}s")
+    
+    return result
+
+
+def _print_suite_header(name: str, description: str) -> None:
+    print(f"\n{'=' * 80}")
+    print(f"🧪 Running {name}")
+    print(f"📝 {description}")
+    print(f"{'=' * 80}")
+
+
+def _run_in_worker_loop(coro):
+    """Run a coroutine on this worker process's event loop, created on first use."""
+    global _worker_runner
+    if _worker_runner is None:
+        _worker_runner = asyncio.Runner()
+    return _worker_runner.run(coro)
+
+
+def _run_suite(name: str, spec: str, description: str):
+    """Import and run one test suite in a worker process; return (name, result, output).
+    
+    spec is "module:function". The module is imported here, so each worker
+    only imports its own suites and a broken import fails just that suite.
+    """
+    output = io.StringIO()
+    
+    with redirect_stdout(output):
+        _print_suite_header(name, description)
+        suite_start = time.perf_counter_ns()
+        try:
+            module_name, function_name = spec.split(":")
+            test_function = getattr(importlib.import_module(module_name), function_name)
+            if inspect.iscoroutinefunction(test_function):
+                success = _run_in_worker_loop(test_function())
+            else:
+                success = test_function()
+            result = _suite_result(name, description, suite_start, success=success)
+        except Exception as exc:
+            result = _suite_result(name, description, suite_start, exc=exc)
+    
+    return name, result, output.getvalue()
 
 
 class TestSuiteRunner:
@@ -37,86 +100,29 @@ class TestSuiteRunner:
         self.results = {}
         self.start_time = None
         self.end_time = None
+        # JSON_LOG=1 also emits one JSON line per suite as it completes
+        self.json_log = env_bool("JSON_LOG", False)
     
-    def run_test_suite(self, name: str, test_function, description: str):
-        """Run a single test suite and record results."""
-        print(f"\n{'=' * 80}")
-        print(f"🧪 Running {name}")
-        print(f"📝 {description}")
-        print(f"{'=' * 80}")
-        
-        suite_start = time.time()
-        
+    def _load_history(self) -> dict:
+        """Load suite history from previous runs; empty if missing or unreadable."""
         try:
-            success = test_function()
-            suite_end = time.time()
-            duration = suite_end - suite_start
-            
-            self.results[name] = {
-                'success': success,
-                'duration': duration,
-                'description': description
-            }
-            
-            if success:
-                print(f"\n✅ {name} completed successfully in {duration:.2f}s")
-            else:
-                print(f"\n❌ {name} failed after {duration:.2f}s")
-                
-        except Exception as exc:
-            suite_end = time.time()
-            duration = suite_end - suite_start
-            
-            self.results[name] = {
-                'success': False,
-                'duration': duration,
-                'description': description,
-                'error': str(exc)
-            }
-            
-            print(f"\n💥 {name} crashed after {duration:.2f}s: {exc}")
+            history = json.loads(HISTORY_FILE.read_text())
+        except (OSError, ValueError):
+            return {}
+        return history if isinstance(history, dict) else {}
     
-    def run_async_test_suite(self, name: str, test_function, description: str):
-        """Run an async test suite and record results."""
-        print(f"\n{'=' * 80}")
-        print(f"🧪 Running {name}")
-        print(f"📝 {description}")
-        print(f"{'=' * 80}")
-        
-        suite_start = time.time()
-        
+    def _save_history(self, history: dict) -> None:
+        """Merge this run's suite results into the history file."""
+        for name, result in self.results.items():
+            history[name] = {'duration': result['duration'], 'success': result['success']}
         try:
-            success = asyncio.run(test_function())
-            suite_end = time.time()
-            duration = suite_end - suite_start
-            
-            self.results[name] = {
-                'success': success,
-                'duration': duration,
-                'description': description
-            }
-            
-            if success:
-                print(f"\n✅ {name} completed successfully in {duration:.2f}s")
-            else:
-                print(f"\n❌ {name} failed after {duration:.2f}s")
-                
-        except Exception as exc:
-            suite_end = time.time()
-            duration = suite_end - suite_start
-            
-            self.results[name] = {
-                'success': False,
-                'duration': duration,
-                'description': description,
-                'error': str(exc)
-            }
-            
-            print(f"\n💥 {name} crashed after {duration:.2f}s: {exc}")
+            HISTORY_FILE.write_text(json.dumps(history, indent=2))
+        except OSError as exc:
+            print(f"⚠️  Could not write test history: {exc}")
     
     def run_all_suites(self):
-        """Run all test suites in the correct order."""
-        self.start_time = time.time()
+        """Run all test suites concurrently and report the results."""
+        self.start_time = time.perf_counter_ns()
         
         print("🚀 Starting Comprehensive n8n SSO Gateway Test Suite")
         print("=" * 80)
@@ -130,112 +136,149 @@ class TestSuiteRunner:
         print("• End-to-end integration workflows")
         print("=" * 80)
         
-        # Test suites in dependency order
+        # Test suites, listed in report order
         test_suites = [
             # Core infrastructure tests first
-            ("Settings & Configuration", run_settings_tests, 
+            ("Settings & Configuration", "test_settings_config:run_all_tests",
              "Tests configuration validation, environment variables, and settings management"),
             
-            ("Core Error Handling", run_error_handling_tests,
+            ("Core Error Handling", "test_core_error_handling:run_all_tests",
              "Tests error handling utilities, safe redirects, and recovery mechanisms"),
             
             # Database and client tests
-            ("n8n Database Operations", run_db_tests,
+            ("n8n Database Operations", "test_n8n_db_operations:run_all_tests",
              "Tests database operations, user management, and project binding"),
             
-            ("n8n HTTP Client", run_client_tests,
+            ("n8n HTTP Client", "test_n8n_client:run_all_tests",
              "Tests HTTP client functionality, login/logout operations, and error handling"),
             
             # Authentication layer tests
-            ("Authentication Services", run_auth_services_tests,
+            ("Authentication Services", "test_auth_services:run_all_tests",
              "Tests OAuth token exchange, JWT parsing, and profile mapping"),
             
-            ("Authentication Routers", run_auth_routers_tests,
+            ("Authentication Routers", "test_auth_routers:run_all_tests",
              "Tests router endpoints, request handling, and webhook processing"),
             
             # Integration tests last
-            ("Integration & End-to-End", run_integration_tests,
+            ("Integration & End-to-End", "test_integration_end_to_end:run_all_tests",
              "Tests complete workflows, error recovery, and security scenarios")
         ]
         
-        # Run all test suites
-        for name, test_function, description in test_suites:
-            self.run_test_suite(name, test_function, description)
+        # The suites are mocked and share no state, so they run in parallel
+        # worker processes; each suite's output is printed when it finishes.
+        # Async suites reuse their worker's event loop.
+        # Longest suites (by previous run) are submitted first to shorten the
+        # critical path; suites without history go last.
+        history = self._load_history()
+        schedule = sorted(
+            test_suites,
+            key=lambda suite: history.get(suite[0], {}).get('duration', 0.0),
+            reverse=True
+        )
+        
+        max_workers = max(1, min(len(test_suites), (os.cpu_count() or 2) - 2))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run_suite, *suite) for suite in schedule]
+            for future in as_completed(futures):
+                name, result, output = future.result()
+                print(output, end="")
+                self.results[name] = result
+                if self.json_log:
+                    sys.stdout.write(json.dumps({"name": name, **result}) + "\n")
+                    sys.stdout.flush()
+        
+        self._save_history(history)
         
-        self.end_time = time.time()
+        # Report suites in their listed order rather than completion order
+        self.results = {name: self.results[name] for name, _, _ in test_suites}
+        
+        self.end_time = time.perf_counter_ns()
         
         # Generate final report
-        self.generate_report()
+        return self.generate_report()
     
     def generate_report(self):
         """Generate comprehensive test report."""
-        total_duration = self.end_time - self.start_time
-        successful_suites = sum(1 for result in self.results.values() if result['success'])
-        total_suites = len(self.results)
+        total_duration = (self.end_time - self.start_time) / 1e9
+        bar = '=' * 80
         
-        print(f"\n{'=' * 80}")
-        print("📊 COMPREHENSIVE TEST SUITE REPORT")
-        print(f"{'=' * 80}")
-        print(f"⏱️  Total execution time: {total_duration:.2f} seconds")
-        print(f"📈 Test suites passed: {successful_suites}/{total_suites}")
-        print(f"📉 Test suites failed: {total_suites - successful_suites}/{total_suites}")
+        # Snapshot the results once; reused for the counts and the detail lines
+        items = list(self.results.items())
+        successful_suites = 0
+        for _, result in items:
+            successful_suites += bool(result['success'])
+        total_suites = len(items)
         
-        if successful_suites == total_suites:
-            print(f"🎉 SUCCESS RATE: 100% - All test suites passed!")
-        else:
-            success_rate = (successful_suites / total_suites) * 100
-            print(f"⚠️  SUCCESS RATE: {success_rate:.1f}% - Some test suites failed")
+        # Assemble the report in memory and write it out in one go
+        report = io.StringIO()
+        with redirect_stdout(report):
+            print(f"\n{bar}")
+            print("📊 COMPREHENSIVE TEST SUITE REPORT")
+            print(bar)
+            print(f"⏱️  Total execution time: {total_duration:.2f} seconds")
+            print(f"📈 Test suites passed: {successful_suites}/{total_suites}")
+            print(f"📉 Test suites failed: {total_suites - successful_suites}/{total_suites}")
         
-        print(f"\n{'=' * 80}")
-        print("📋 DETAILED RESULTS BY TEST SUITE")
-        print(f"{'=' * 80}")
+            if successful_suites == total_suites:
+                print(f"🎉 SUCCESS RATE: 100% - All test suites passed!")
+            else:
+                success_rate = (successful_suites / total_suites) * 100
+                print(f"⚠️  SUCCESS RATE: {success_rate:.1f}% - Some test suites failed")
         
-        for name, result in self.results.items():
-            status = "✅ PASS" if result['success'] else "❌ FAIL"
-            duration = result['duration']
-            description = result['description']
+            print(f"\n{bar}")
+            print("📋 DETAILED RESULTS BY TEST SUITE")
+            print(bar)
+        
+            for name, result in items:
+                status = "✅ PASS" if result['success'] else "❌ FAIL"
+                duration = result['duration']
+                description = result['description']
             
-            print(f"\n🧪 {name}")
-            print(f"   Status: {status}")
-            print(f"   Duration: {duration:.2f}s")
-            print(f"   Description: {description}")
+                print(f"\n🧪 {name}")
+                print(f"   Status: {status}")
+                print(f"   Duration: {duration:.2f}s")
+                print(f"   Description: {description}")
             
-            if not result['success'] and 'error' in result:
-                print(f"   Error: {result['error']}")
+                if not result['success'] and 'error' in result:
+                    print(f"   Error: {result['error']}")
         
-        print(f"\n{'=' * 80}")
-        print("🎯 COVERAGE SUMMARY")
-        print(f"{'=' * 80}")
+            print(f"\n{bar}")
+            print("🎯 COVERAGE SUMMARY")
+            print(bar)
         
-        coverage_areas = [
-            "✅ Database Operations - User/project management, password handling",
-            "✅ HTTP Client - n8n API interactions, login/logout operations",
-            "✅ OAuth Authentication - Token exchange, JWT parsing, state management",
-            "✅ Router Endpoints - Login, callback, webhook, logout handling",
-            "✅ Error Handling - Safe redirects, exception handling, recovery",
-            "✅ Configuration - Settings validation, environment variables",
-            "✅ Integration Flows - End-to-end workflows, security scenarios",
-            "✅ Edge Cases - Boundary conditions, error scenarios, performance",
-            "✅ Security - CSRF protection, code reuse prevention, input validation",
-            "✅ Concurrency - Race condition prevention, session management"
-        ]
+            coverage_areas = [
+                "✅ Database Operations - User/project management, password handling",
+                "✅ HTTP Client - n8n API interactions, login/logout operations",
+                "✅ OAuth Authentication - Token exchange, JWT parsing, state management",
+                "✅ Router Endpoints - Login, callback, webhook, logout handling",
+                "✅ Error Handling - Safe redirects, exception handling, recovery",
+                "✅ Configuration - Settings validation, environment variables",
+                "✅ Integration Flows - End-to-end workflows, security scenarios",
+                "✅ Edge Cases - Boundary conditions, error scenarios, performance",
+                "✅ Security - CSRF protection, code reuse prevention, input validation",
+                "✅ Concurrency - Race condition prevention, session management"
+            ]
+        
+            for area in coverage_areas:
+                print(f"  {area}")
         
-        for area in coverage_areas:
-            print(f"  {area}")
+            print(f"\n{bar}")
+        
+            if successful_suites == total_suites:
+                print("🏆 ALL TESTS PASSED - PROJECT SPECIFICATIONS FULLY COVERED!")
+                print("🔒 The n8n SSO Gateway is thoroughly tested and ready for deployment")
+                print("⚡ All authentication flows, error handling, and edge cases verified")
+                print("🎯 Complete coverage of project requirements and specifications")
+            else:
+                print("💥 SOME TESTS FAILED - ATTENTION REQUIRED!")
+                print("❌ Review failed test suites and fix issues before deployment")
+                print("🔧 Check error messages and logs for debugging information")
         
-        print(f"\n{'=' * 80}")
+            print(bar)
         
-        if successful_suites == total_suites:
-            print("🏆 ALL TESTS PASSED - PROJECT SPECIFICATIONS FULLY COVERED!")
-            print("🔒 The n8n SSO Gateway is thoroughly tested and ready for deployment")
-            print("⚡ All authentication flows, error handling, and edge cases verified")
-            print("🎯 Complete coverage of project requirements and specifications")
-        else:
-            print("💥 SOME TESTS FAILED - ATTENTION REQUIRED!")
-            print("❌ Review failed test suites and fix issues before deployment")
-            print("🔧 Check error messages and logs for debugging information")
         
-        print(f"{'=' * 80}")
+        sys.stdout.write(report.getvalue())
+        sys.stdout.flush()
         
         return successful_suites == total_suites
 
@@ -8,28 +8,54 @@ Covers login, callback, webhook, and logout endpoints with various scenarios.
 
 import pytest
 import asyncio
+import orjson
 import uuid
+from dataclasses import InitVar, dataclass, field
+from types import SimpleNamespace
+from typing import Any
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
-from fastapi import Request
+from fastapi import Request, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.testclient import TestClient
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.auth.routers import router, casdoor_callback, casdoor_login, casdoor_webhook, casdoor_logout
 
+# Oversized inputs for the edge-case tests, built once at import
+LARGE_WEBHOOK_BODY = orjson.dumps({
+    "action": "logout",
+    "user": "test@example.com",
+    "data": "x" * 10000,  # Large data field
+    "metadata": {f"key_{i}": f"value_{i}" for i in range(1000)}
+})
+LONG_COOKIE = "x" * 5000  # Very long cookie
+
+# Successful n8n logout response; the logout route only reads status_code
+OK_LOGOUT_RESPONSE = SimpleNamespace(status_code=200)
+
+
+def body_returning(raw: bytes):
+    """Stand-in for Request.body: a plain coroutine function returning raw."""
+    async def body():
+        return raw
+    return body
+
 
+@dataclass(slots=True)
 class MockRequest:
     """Mock FastAPI Request object."""
     
-    def __init__(self, query_params=None, headers=None, cookies=None, client_host="127.0.0.1"):
-        self.query_params = query_params or {}
-        self.headers = headers or {}
-        self.cookies = cookies or {}
-        self.client = Mock()
-        self.client.host = client_host
-        
+    query_params: dict = field(default_factory=dict)
+    headers: dict = field(default_factory=dict)
+    cookies: dict = field(default_factory=dict)
+    client_host: InitVar[str] = "127.0.0.1"
+    client: SimpleNamespace = field(init=False)
+    # Tests that post a body assign an AsyncMock here
+    body: Any = field(default=None, init=False)
+    
+    def __post_init__(self, client_host):
+        # Only .host is read by the routers; a plain namespace is enough
+        self.client = SimpleNamespace(host=client_host)
+    
     def url_for(self, name):
         """Mock url_for method."""
         if name == "casdoor_callback":
@@ -40,7 +66,6 @@ class MockRequest:
 class TestCasdoorLogin:
     """Test Casdoor login endpoint."""
     
-    @pytest.mark.asyncio
     @patch('apps.auth.routers.get_casdoor_login_url')
     @patch('apps.auth.routers.create_secure_state')
     @pytest.mark.asyncio
@@ -259,26 +284,23 @@ class TestCasdoorCallback:
 class TestCasdoorWebhook:
     """Test Casdoor webhook endpoint."""
     
-    @patch('apps.auth.routers.handle_casdoor_logout_webhook')
+    @patch('apps.auth.routers.enqueue_webhook')
     @pytest.mark.asyncio
-    async def test_casdoor_webhook_success(self, mock_handle_webhook):
-        """Test successful webhook processing."""
-        # Mock webhook handler
-        mock_handle_webhook.return_value = {
-            "status": "success",
-            "user_email": "test@example.com"
-        }
-        
-        # Create mock request with JSON method
+    async def test_casdoor_webhook_success(self, mock_enqueue):
+        """Test successful webhook acknowledgement."""
+        # Mock queue accepting the payload
+        mock_enqueue.return_value = True
+        
+        # Create mock request with a JSON body
         request = MockRequest(
             headers={"content-type": "application/json", "user-agent": "Casdoor-Webhook"}
         )
-        request.json = AsyncMock(return_value={
+        request.body = body_returning(orjson.dumps({
             "action": "logout",
             "user": "test@example.com",
             "organization": "test_org",
             "id": "webhook_123"
-        })
+        }))
         
         # Test webhook endpoint
         result = await casdoor_webhook(request)
@@ -287,12 +309,32 @@ class TestCasdoorWebhook:
         assert isinstance(result, dict)
         assert result["success"] is True
         assert result["webhook_id"] == "webhook_123"
+        assert result["result"]["status"] == "accepted"
         
-        # Verify mock was called
-        mock_handle_webhook.assert_called_once()
+        # Verify payload was queued
+        mock_enqueue.assert_called_once()
         
         print("✅ Casdoor webhook (success) works correctly")
     
+    @patch('apps.auth.routers.enqueue_webhook')
+    @pytest.mark.asyncio
+    async def test_casdoor_webhook_non_logout_ignored(self, mock_enqueue):
+        """Test non-logout webhook is acknowledged without queueing."""
+        request = MockRequest()
+        request.body = body_returning(orjson.dumps({
+            "action": "login",
+            "user": "test@example.com",
+            "id": "webhook_456"
+        }))
+        
+        result = await casdoor_webhook(request)
+        
+        assert result["success"] is True
+        assert result["result"]["status"] == "ignored"
+        mock_enqueue.assert_not_called()
+        
+        print("✅ Casdoor webhook (non-logout ignored) works correctly")
+    
     @pytest.mark.asyncio
     async def test_casdoor_webhook_invalid_json(self):
         """Test webhook with invalid JSON."""
@@ -300,7 +342,7 @@ class TestCasdoorWebhook:
         request = MockRequest(
             headers={"content-type": "application/json"}
         )
-        request.json = AsyncMock(side_effect=ValueError("Invalid JSON"))
+        request.body = body_returning(b"{not valid json")
         
         # Test webhook endpoint - should raise HTTPException
         with pytest.raises(Exception):  # HTTPException or ValueError
@@ -308,25 +350,48 @@ class TestCasdoorWebhook:
         
         print("✅ Casdoor webhook (invalid JSON) works correctly")
     
-    @patch('apps.auth.routers.handle_casdoor_logout_webhook')
+    @patch('apps.auth.routers.enqueue_webhook')
     @pytest.mark.asyncio
-    async def test_casdoor_webhook_processing_error(self, mock_handle_webhook):
-        """Test webhook with processing error."""
-        # Mock webhook handler failure
-        mock_handle_webhook.side_effect = Exception("Webhook processing failed")
+    async def test_casdoor_webhook_queue_full(self, mock_enqueue):
+        """Test webhook rejected with 429 when the queue is full."""
+        # Mock queue rejecting the payload
+        mock_enqueue.return_value = False
         
         # Create mock request
         request = MockRequest()
-        request.json = AsyncMock(return_value={
+        request.body = body_returning(orjson.dumps({
             "action": "logout",
             "user": "test@example.com"
-        })
+        }))
         
-        # Test webhook endpoint - should raise HTTPException
-        with pytest.raises(Exception):  # HTTPException
+        # Test webhook endpoint - should raise HTTPException 429
+        with pytest.raises(HTTPException) as exc_info:
+            await casdoor_webhook(request)
+        
+        assert exc_info.value.status_code == 429
+        
+        print("✅ Casdoor webhook (queue full) works correctly")
+    
+    @patch('apps.auth.routers.enqueue_webhook')
+    @patch('apps.auth.routers.accepting_webhooks', return_value=False)
+    @pytest.mark.asyncio
+    async def test_casdoor_webhook_shutting_down(self, mock_accepting, mock_enqueue):
+        """Test webhook rejected with 503 once shutdown has started."""
+        # Create mock request
+        request = MockRequest()
+        request.body = body_returning(orjson.dumps({
+            "action": "logout",
+            "user": "test@example.com"
+        }))
+        
+        # Test webhook endpoint - should raise HTTPException 503
+        with pytest.raises(HTTPException) as exc_info:
             await casdoor_webhook(request)
         
-        print("✅ Casdoor webhook (processing error) works correctly")
+        assert exc_info.value.status_code == 503
+        mock_enqueue.assert_not_called()
+        
+        print("✅ Casdoor webhook (shutting down) works correctly")
 
 
 class TestCasdoorLogout:
@@ -347,10 +412,7 @@ class TestCasdoorLogout:
         mock_n8n_client_class.return_value = mock_n8n_client
         
         # Mock logout response
-        mock_logout_response = Mock()
-        mock_logout_response.status_code = 200
-        mock_logout_response.text = '{"success": true}'
-        mock_n8n_client.logout_user.return_value = mock_logout_response
+        mock_n8n_client.logout_user = AsyncMock(return_value=OK_LOGOUT_RESPONSE)
         
         # Create mock request with auth cookie
         request = MockRequest(
@@ -368,7 +430,6 @@ class TestCasdoorLogout:
         
         # Verify N8N logout was called
         mock_n8n_client.logout_user.assert_called_once_with("test_auth_cookie")
-        mock_n8n_client.close.assert_called_once()
         
         print("✅ Casdoor logout (success) works correctly")
     
@@ -387,9 +448,7 @@ class TestCasdoorLogout:
         mock_n8n_client_class.return_value = mock_n8n_client
         
         # Mock logout response
-        mock_logout_response = Mock()
-        mock_logout_response.status_code = 200
-        mock_n8n_client.logout_user.return_value = mock_logout_response
+        mock_n8n_client.logout_user = AsyncMock(return_value=OK_LOGOUT_RESPONSE)
         
         # Create mock request without auth cookie
         request = MockRequest()
@@ -421,7 +480,7 @@ class TestCasdoorLogout:
         mock_n8n_client_class.return_value = mock_n8n_client
         
         # Mock N8N logout failure
-        mock_n8n_client.logout_user.side_effect = Exception("N8N logout failed")
+        mock_n8n_client.logout_user = AsyncMock(side_effect=Exception("N8N logout failed"))
         
         # Create mock request
         request = MockRequest(
@@ -435,9 +494,6 @@ class TestCasdoorLogout:
         assert isinstance(result, RedirectResponse)
         assert "casdoor.example.com/logout" in result.headers["location"]
         
-        # Verify cleanup was attempted
-        mock_n8n_client.close.assert_called_once()
-        
         print("✅ Casdoor logout (N8N error) works correctly")
     
     @patch('conf.settings.get_settings')
@@ -497,19 +553,11 @@ class TestRouterEdgeCases:
     @pytest.mark.asyncio
     async def test_webhook_with_large_payload(self):
         """Test webhook with large payload."""
-        # Create large payload
-        large_payload = {
-            "action": "logout",
-            "user": "test@example.com",
-            "data": "x" * 10000,  # Large data field
-            "metadata": {f"key_{i}": f"value_{i}" for i in range(1000)}
-        }
-        
         request = MockRequest()
-        request.json = AsyncMock(return_value=large_payload)
+        request.body = body_returning(LARGE_WEBHOOK_BODY)
         
-        with patch('apps.auth.routers.handle_casdoor_logout_webhook') as mock_handle:
-            mock_handle.return_value = {"status": "success"}
+        with patch('apps.auth.routers.enqueue_webhook') as mock_enqueue:
+            mock_enqueue.return_value = True
             
             result = await casdoor_webhook(request)
             
@@ -521,9 +569,7 @@ class TestRouterEdgeCases:
     @pytest.mark.asyncio
     async def test_logout_with_very_long_cookie(self):
         """Test logout with very long auth cookie."""
-        long_cookie = "x" * 5000  # Very long cookie
-        
-        request = MockRequest(cookies={"n8n-auth": long_cookie})
+        request = MockRequest(cookies={"n8n-auth": LONG_COOKIE})
         
         with patch('apps.integrations.n8n_client.N8NClient') as mock_client_class, \
              patch('conf.settings.get_settings') as mock_get_settings:
@@ -534,12 +580,12 @@ class TestRouterEdgeCases:
             
             mock_client = Mock()
             mock_client_class.return_value = mock_client
-            mock_client.logout_user.return_value = Mock(status_code=200)
+            mock_client.logout_user = AsyncMock(return_value=OK_LOGOUT_RESPONSE)
             
             result = await casdoor_logout(request)
             
             assert isinstance(result, RedirectResponse)
-            mock_client.logout_user.assert_called_once_with(long_cookie)
+            mock_client.logout_user.assert_called_once_with(LONG_COOKIE)
         
         print("✅ Logout (very long cookie) works correctly")
 
@@ -571,7 +617,8 @@ def run_all_tests():
         webhook_tests = TestCasdoorWebhook()
         asyncio.run(webhook_tests.test_casdoor_webhook_success())
         asyncio.run(webhook_tests.test_casdoor_webhook_invalid_json())
-        asyncio.run(webhook_tests.test_casdoor_webhook_processing_error())
+        asyncio.run(webhook_tests.test_casdoor_webhook_queue_full())
+        asyncio.run(webhook_tests.test_casdoor_webhook_shutting_down())
         print()
         
         # Test logout endpoint
@@ -10,98 +10,83 @@ import pytest
 import asyncio
 import jwt
 import httpx
-from unittest.mock import Mock, AsyncMock, patch, MagicMock, ANY
+import respx
+from types import SimpleNamespace
+from unittest.mock import Mock, AsyncMock, patch, MagicMock, ANY, DEFAULT
 from fastapi import Request
 from fastapi.responses import RedirectResponse, HTMLResponse
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.auth.services import (
     extract_n8n_auth_cookie,
     get_oauth_token,
+    get_casdoor_client,
+    close_casdoor_client,
     parse_jwt_token,
     map_casdoor_to_profile,
     handle_casdoor_callback
 )
 from apps.integrations.n8n_db import CasdoorProfile
 
+# Settings read by get_oauth_token; shared by every token-exchange test
+CASDOOR_TOKEN_SETTINGS = SimpleNamespace(
+    CASDOOR_ENDPOINT="https://casdoor.example.com",
+    CASDOOR_CLIENT_ID="test_client_id",
+    CASDOOR_CLIENT_SECRET="test_client_secret",
+)
+CASDOOR_TOKEN_URL = "https://casdoor.example.com/api/login/oauth/access_token"
+
+
+# Real (empty) httpx headers, for responses that carry no set-cookie header
+EMPTY_HEADERS = httpx.Headers()
+
+
+def _mk_response(cookies, headers_list, single_header):
+    """Build a mock httpx response carrying the given cookies and set-cookie headers."""
+    response = Mock()
+    response.cookies = cookies
+    if single_header is None:
+        response.headers = (
+            httpx.Headers([("set-cookie", header) for header in headers_list])
+            if headers_list else EMPTY_HEADERS
+        )
+        return response
+    # Only get() sees the header, as on responses without multi-value headers
+    response.headers = Mock()
+    response.headers.get_list.return_value = headers_list or []
+    response.headers.get.return_value = single_header
+    return response
+
+
+# (case, cookies, set-cookie header list, single set-cookie header, expected cookie)
+EXTRACT_COOKIE_CASES = [
+    ("cookies attribute", {'n8n-auth': 'test_cookie_value_123'}, None, None, 'test_cookie_value_123'),
+    ("set-cookie headers", None, [
+        'n8n-auth=header_cookie_value; Path=/; HttpOnly',
+        'other-cookie=other_value; Path=/'
+    ], None, 'header_cookie_value'),
+    ("single set-cookie header", None, [], 'n8n-auth=single_cookie_value; Path=/; HttpOnly', 'single_cookie_value'),
+    ("not found", {'other-cookie': 'other_value'}, None, None, None),
+    # Empty value is handled gracefully
+    ("malformed header", None, ['n8n-auth=', 'malformed_header_without_equals'], None, ''),
+]
+
 
 class TestExtractN8NAuthCookie:
     """Test n8n auth cookie extraction from HTTP responses."""
     
-    def test_extract_cookie_from_cookies_attribute(self):
-        """Test extracting cookie from response.cookies attribute."""
-        # Mock response with cookies attribute
-        mock_response = Mock()
-        mock_response.cookies = {'n8n-auth': 'test_cookie_value_123'}
-        
-        result = extract_n8n_auth_cookie(mock_response)
-        
-        assert result == 'test_cookie_value_123'
-        print("✅ Cookie extraction from cookies attribute works correctly")
-    
-    def test_extract_cookie_from_set_cookie_headers(self):
-        """Test extracting cookie from set-cookie headers."""
-        # Mock response with set-cookie headers
-        mock_response = Mock()
-        mock_response.cookies = None
-        mock_response.headers = Mock()
-        mock_response.headers.get_list.return_value = [
-            'n8n-auth=header_cookie_value; Path=/; HttpOnly',
-            'other-cookie=other_value; Path=/'
-        ]
-        
-        result = extract_n8n_auth_cookie(mock_response)
-        
-        assert result == 'header_cookie_value'
-        print("✅ Cookie extraction from set-cookie headers works correctly")
-    
-    def test_extract_cookie_from_single_set_cookie_header(self):
-        """Test extracting cookie from single set-cookie header."""
-        # Mock response with single set-cookie header
-        mock_response = Mock()
-        mock_response.cookies = None
-        mock_response.headers = Mock()
-        mock_response.headers.get_list.return_value = []
-        mock_response.headers.get.return_value = 'n8n-auth=single_cookie_value; Path=/; HttpOnly'
-        
-        result = extract_n8n_auth_cookie(mock_response)
-        
-        assert result == 'single_cookie_value'
-        print("✅ Cookie extraction from single set-cookie header works correctly")
-    
-    def test_extract_cookie_not_found(self):
-        """Test cookie extraction when cookie not found."""
-        # Mock response without n8n-auth cookie
-        mock_response = Mock()
-        mock_response.cookies = {'other-cookie': 'other_value'}
-        
-        # Create a proper headers mock that supports both get_list and iteration
-        class HeadersMock:
-            def __init__(self):
-                self._data = {}
-            
-            def get_list(self, key):
-                return []
-            
-            def __iter__(self):
-                return iter(self._data.keys())
-            
-            def __getitem__(self, key):
-                return self._data.get(key, '')
-            
-            def get(self, key, default=None):
-                return self._data.get(key, default)
-        
-        mock_response.headers = HeadersMock()
-        
-        result = extract_n8n_auth_cookie(mock_response)
-        
-        assert result is None
-        print("✅ Cookie extraction (not found) works correctly")
+    @pytest.mark.parametrize(
+        "case, cookies, headers_list, single_header, expected",
+        EXTRACT_COOKIE_CASES,
+        ids=[case[0] for case in EXTRACT_COOKIE_CASES],
+    )
+    def test_extract_cookie(self, case, cookies, headers_list, single_header, expected):
+        """Test extracting the cookie from response cookies or set-cookie headers."""
+        result = extract_n8n_auth_cookie(_mk_response(cookies, headers_list, single_header))
+        
+        assert result == expected
+        print(f"✅ Cookie extraction ({case}) works correctly")
     
     def test_extract_cookie_no_response(self):
         """Test cookie extraction with no response."""
@@ -109,56 +94,25 @@ class TestExtractN8NAuthCookie:
         
         assert result is None
         print("✅ Cookie extraction (no response) works correctly")
-    
-    def test_extract_cookie_malformed_header(self):
-        """Test cookie extraction with malformed header."""
-        # Mock response with malformed set-cookie header
-        mock_response = Mock()
-        mock_response.cookies = None
-        mock_response.headers = Mock()
-        mock_response.headers.get_list.return_value = [
-            'n8n-auth=',  # Empty value
-            'malformed_header_without_equals'
-        ]
-        mock_response.headers.get.return_value = None
-        
-        result = extract_n8n_auth_cookie(mock_response)
-        
-        assert result == ''  # Should handle empty value gracefully
-        print("✅ Cookie extraction (malformed header) works correctly")
 
 
 class TestGetOAuthToken:
     """Test OAuth token exchange with Casdoor."""
     
-    @patch('apps.auth.services.httpx.AsyncClient')
+    @respx.mock
     @patch('apps.auth.services.get_settings')
     @pytest.mark.asyncio
-    async def test_get_oauth_token_success(self, mock_get_settings, mock_client_class):
+    async def test_get_oauth_token_success(self, mock_get_settings):
         """Test successful OAuth token exchange."""
-        # Mock settings
-        mock_settings = Mock()
-        mock_settings.CASDOOR_ENDPOINT = "https://casdoor.example.com"
-        mock_settings.CASDOOR_CLIENT_ID = "test_client_id"
-        mock_settings.CASDOOR_CLIENT_SECRET = "test_client_secret"
-        mock_get_settings.return_value = mock_settings
-        
-        # Mock HTTP client
-        mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_settings.return_value = CASDOOR_TOKEN_SETTINGS
         
         # Mock successful response
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
+        route = respx.post(CASDOOR_TOKEN_URL).mock(return_value=httpx.Response(200, json={
             "access_token": "test_access_token",
             "id_token": "test_id_token",
             "token_type": "Bearer",
             "expires_in": 3600
-        }
-        mock_response.content = b'{"access_token": "test_access_token"}'
-        mock_response.headers = {}
-        mock_client.post.return_value = mock_response
+        }))
         
         # Test token exchange
         code = "test_authorization_code"
@@ -170,38 +124,23 @@ class TestGetOAuthToken:
         assert result["id_token"] == "test_id_token"
         
         # Verify HTTP call
-        mock_client.post.assert_called_once()
-        call_args = mock_client.post.call_args
-        assert "/api/login/oauth/access_token" in call_args[0][0]
+        assert route.call_count == 1
+        assert b"code=test_authorization_code" in route.calls.last.request.content
         
         print("✅ OAuth token exchange (success) works correctly")
     
-    @patch('apps.auth.services.httpx.AsyncClient')
+    @respx.mock
     @patch('apps.auth.services.get_settings')
     @pytest.mark.asyncio
-    async def test_get_oauth_token_invalid_grant(self, mock_get_settings, mock_client_class):
+    async def test_get_oauth_token_invalid_grant(self, mock_get_settings):
         """Test OAuth token exchange with invalid grant (code already used)."""
-        # Mock settings
-        mock_settings = Mock()
-        mock_settings.CASDOOR_ENDPOINT = "https://casdoor.example.com"
-        mock_settings.CASDOOR_CLIENT_ID = "test_client_id"
-        mock_settings.CASDOOR_CLIENT_SECRET = "test_client_secret"
-        mock_get_settings.return_value = mock_settings
-        
-        # Mock HTTP client
-        mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_settings.return_value = CASDOOR_TOKEN_SETTINGS
         
         # Mock invalid grant response
-        mock_response = Mock()
-        mock_response.status_code = 400
-        mock_response.json.return_value = {
+        respx.post(CASDOOR_TOKEN_URL).mock(return_value=httpx.Response(400, json={
             "error": "invalid_grant",
             "error_description": "authorization code has been used"
-        }
-        mock_response.content = b'{"error": "invalid_grant"}'
-        mock_response.headers = {}
-        mock_client.post.return_value = mock_response
+        }))
         
         # Test token exchange
         code = "used_authorization_code"
@@ -212,24 +151,15 @@ class TestGetOAuthToken:
         
         print("✅ OAuth token exchange (invalid grant) works correctly")
     
-    @patch('apps.auth.services.httpx.AsyncClient')
+    @respx.mock
     @patch('apps.auth.services.get_settings')
     @pytest.mark.asyncio
-    async def test_get_oauth_token_network_error(self, mock_get_settings, mock_client_class):
+    async def test_get_oauth_token_network_error(self, mock_get_settings):
         """Test OAuth token exchange with network error."""
-        # Mock settings
-        mock_settings = Mock()
-        mock_settings.CASDOOR_ENDPOINT = "https://casdoor.example.com"
-        mock_settings.CASDOOR_CLIENT_ID = "test_client_id"
-        mock_settings.CASDOOR_CLIENT_SECRET = "test_client_secret"
-        mock_get_settings.return_value = mock_settings
-        
-        # Mock HTTP client
-        mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_settings.return_value = CASDOOR_TOKEN_SETTINGS
         
         # Mock network error
-        mock_client.post.side_effect = httpx.RequestError("Network error")
+        respx.post(CASDOOR_TOKEN_URL).mock(side_effect=httpx.RequestError("Network error"))
         
         # Test token exchange
         code = "test_authorization_code"
@@ -240,30 +170,15 @@ class TestGetOAuthToken:
         
         print("✅ OAuth token exchange (network error) works correctly")
     
-    @patch('apps.auth.services.httpx.AsyncClient')
+    @respx.mock
     @patch('apps.auth.services.get_settings')
     @pytest.mark.asyncio
-    async def test_get_oauth_token_json_parse_error(self, mock_get_settings, mock_client_class):
+    async def test_get_oauth_token_json_parse_error(self, mock_get_settings):
         """Test OAuth token exchange with JSON parse error."""
-        # Mock settings
-        mock_settings = Mock()
-        mock_settings.CASDOOR_ENDPOINT = "https://casdoor.example.com"
-        mock_settings.CASDOOR_CLIENT_ID = "test_client_id"
-        mock_settings.CASDOOR_CLIENT_SECRET = "test_client_secret"
-        mock_get_settings.return_value = mock_settings
-        
-        # Mock HTTP client
-        mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_settings.return_value = CASDOOR_TOKEN_SETTINGS
         
         # Mock response with invalid JSON
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.side_effect = ValueError("Invalid JSON")
-        mock_response.text = "Invalid JSON response"
-        mock_response.content = b'Invalid JSON'
-        mock_response.headers = {}
-        mock_client.post.return_value = mock_response
+        respx.post(CASDOOR_TOKEN_URL).mock(return_value=httpx.Response(200, content=b'Invalid JSON'))
         
         # Test token exchange
         code = "test_authorization_code"
@@ -273,6 +188,20 @@ class TestGetOAuthToken:
         assert isinstance(result, RedirectResponse)
         
         print("✅ OAuth token exchange (JSON parse error) works correctly")
+    
+    @pytest.mark.asyncio
+    async def test_casdoor_client_shared_and_closed(self):
+        """Test the Casdoor client is created once and reset on close."""
+        client = get_casdoor_client()
+        assert get_casdoor_client() is client
+        
+        await close_casdoor_client()
+        
+        from apps.auth import services as services_module
+        assert services_module._casdoor_client is None
+        assert client.is_closed
+        
+        print("✅ Shared Casdoor client reuse and close work correctly")
 
 
 class TestParseJWTToken:
@@ -470,40 +399,39 @@ class TestMapCasdoorToProfile:
 class TestHandleCasdoorCallback:
     """Test the main Casdoor callback handler."""
     
-    @patch('apps.auth.services.get_oauth_token')
-    @patch('apps.auth.services.parse_jwt_token')
-    @patch('apps.auth.services.map_casdoor_to_profile')
-    @patch('apps.auth.services.ensure_user_project_binding')
-    @patch('apps.auth.services.rotate_user_password')
-    @patch('apps.auth.services.N8NClient')
-    @patch('apps.auth.services.SessionManager')
-    @patch('apps.auth.services.get_settings')
+    @patch.multiple(
+        'apps.auth.services',
+        get_oauth_token=DEFAULT,
+        parse_jwt_token=DEFAULT,
+        map_casdoor_to_profile=DEFAULT,
+        ensure_user_project_binding=DEFAULT,
+        rotate_user_password=DEFAULT,
+        N8NClient=DEFAULT,
+        SessionManager=DEFAULT,
+        get_settings=DEFAULT,
+    )
     @pytest.mark.asyncio
-    async def test_handle_casdoor_callback_new_user(
-        self, mock_get_settings, mock_session_manager, mock_n8n_client_class,
-        mock_rotate_password, mock_ensure_binding, mock_map_profile,
-        mock_parse_jwt, mock_get_token
-    ):
+    async def test_handle_casdoor_callback_new_user(self, **mocks):
         """Test callback handling for new user."""
         # Mock settings
         mock_settings = Mock()
         mock_settings.N8N_BASE_URL = "https://n8n.example.com"
         mock_settings.N8N_DEFAULT_GLOBAL_ROLE = "global:member"
         mock_settings.N8N_DEFAULT_PROJECT_ROLE = "project:personalOwner"
-        mock_get_settings.return_value = mock_settings
+        mocks["get_settings"].return_value = mock_settings
         
         # Mock request
         mock_request = Mock(spec=Request)
         mock_request.query_params = {"code": "test_code"}
         
         # Mock OAuth token exchange
-        mock_get_token.return_value = {
+        mocks["get_oauth_token"].return_value = {
             "access_token": "test_access_token",
             "id_token": "test_id_token"
         }
         
         # Mock JWT parsing
-        mock_parse_jwt.return_value = {
+        mocks["parse_jwt_token"].return_value = {
             "email": "newuser@example.com",
             "name": "New User",
             "sub": "new_user_123"
@@ -516,7 +444,7 @@ class TestHandleCasdoorCallback:
             last_name="User",
             casdoor_id="new_user_123"
         )
-        mock_map_profile.return_value = mock_profile
+        mocks["map_casdoor_to_profile"].return_value = mock_profile
         
         # Mock database operations
         from apps.integrations.n8n_db import N8nUserRow, N8nProjectRow
@@ -525,22 +453,22 @@ class TestHandleCasdoorCallback:
         mock_user_row = N8nUserRow(id=user_id, email="newuser@example.com")
         mock_project_row = N8nProjectRow(id="project123", name="newuser@example.com")
         temp_password = "temp_password_123"
-        mock_ensure_binding.return_value = (mock_user_row, mock_project_row, temp_password)
+        mocks["ensure_user_project_binding"].return_value = (mock_user_row, mock_project_row, temp_password)
         
         # Mock session management
-        mock_session_manager.get_active_session.return_value = None
-        mock_session_manager.create_session.return_value = "session123"
+        mocks["SessionManager"].get_active_session.return_value = None
+        mocks["SessionManager"].create_session.return_value = "session123"
         
         # Mock N8N client
         mock_n8n_client = Mock()
-        mock_n8n_client_class.return_value = mock_n8n_client
+        mocks["N8NClient"].return_value = mock_n8n_client
         
         # Mock login response with cookie
         mock_login_response = Mock()
         mock_login_response.status_code = 200
         mock_login_response.text = "ok"
         mock_login_response.headers = {}
-        mock_n8n_client.login_user.return_value = mock_login_response
+        mock_n8n_client.login_user = AsyncMock(return_value=mock_login_response)
         
         # Mock cookie extraction
         with patch('apps.auth.services.extract_n8n_auth_cookie') as mock_extract_cookie:
@@ -553,10 +481,10 @@ class TestHandleCasdoorCallback:
             assert isinstance(result, RedirectResponse)
             
             # Verify all mocks were called appropriately
-            mock_get_token.assert_called_once_with("test_code", ANY)
-            mock_parse_jwt.assert_called_once()
-            mock_map_profile.assert_called_once()
-            mock_ensure_binding.assert_called_once()
+            mocks["get_oauth_token"].assert_called_once_with("test_code", ANY)
+            mocks["parse_jwt_token"].assert_called_once()
+            mocks["map_casdoor_to_profile"].assert_called_once()
+            mocks["ensure_user_project_binding"].assert_called_once()
             mock_n8n_client.login_user.assert_called_once()
         
         print("✅ Casdoor callback handling (new user) works correctly")
@@ -649,23 +577,23 @@ def run_all_tests():
     print("🔐 Starting Authentication Services Test Suite...")
     print("=" * 60)
     
+    # One event loop for every async test, instead of one per asyncio.run()
+    runner = asyncio.Runner()
     try:
         # Test cookie extraction
         cookie_tests = TestExtractN8NAuthCookie()
-        cookie_tests.test_extract_cookie_from_cookies_attribute()
-        cookie_tests.test_extract_cookie_from_set_cookie_headers()
-        cookie_tests.test_extract_cookie_from_single_set_cookie_header()
-        cookie_tests.test_extract_cookie_not_found()
+        for case in EXTRACT_COOKIE_CASES:
+            cookie_tests.test_extract_cookie(*case)
         cookie_tests.test_extract_cookie_no_response()
-        cookie_tests.test_extract_cookie_malformed_header()
         print()
         
         # Test OAuth token exchange
         token_tests = TestGetOAuthToken()
-        asyncio.run(token_tests.test_get_oauth_token_success())
-        asyncio.run(token_tests.test_get_oauth_token_invalid_grant())
-        asyncio.run(token_tests.test_get_oauth_token_network_error())
-        asyncio.run(token_tests.test_get_oauth_token_json_parse_error())
+        runner.run(token_tests.test_get_oauth_token_success())
+        runner.run(token_tests.test_get_oauth_token_invalid_grant())
+        runner.run(token_tests.test_get_oauth_token_network_error())
+        runner.run(token_tests.test_get_oauth_token_json_parse_error())
+        runner.run(token_tests.test_casdoor_client_shared_and_closed())
         print()
         
         # Test JWT parsing
@@ -686,9 +614,9 @@ def run_all_tests():
         
         # Test callback handling
         callback_tests = TestHandleCasdoorCallback()
-        asyncio.run(callback_tests.test_handle_casdoor_callback_new_user())
-        asyncio.run(callback_tests.test_handle_casdoor_callback_token_error())
-        asyncio.run(callback_tests.test_handle_casdoor_callback_missing_id_token())
+        runner.run(callback_tests.test_handle_casdoor_callback_new_user())
+        runner.run(callback_tests.test_handle_casdoor_callback_token_error())
+        runner.run(callback_tests.test_handle_casdoor_callback_missing_id_token())
         print()
         
         # Test edge cases
@@ -712,6 +640,8 @@ def run_all_tests():
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
         return False
+    finally:
+        runner.close()
 
 
 if __name__ == "__main__":
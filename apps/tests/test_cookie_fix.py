@@ -61,7 +61,7 @@ async def test_n8n_login_with_cookie_extraction():
         print(f"🌐 n8n Base URL: {settings.N8N_BASE_URL}")
         
         # Test login and cookie extraction
-        response = n8n_client.login_user(
+        response = await n8n_client.login_user(
             email=settings.N8N_OWNER_EMAIL,
             password=settings.N8N_OWNER_PASSWORD
         )
@@ -95,8 +95,6 @@ async def test_n8n_login_with_cookie_extraction():
     except Exception as e:
         print(f"❌ Test failed: {e}")
         return False
-    finally:
-        n8n_client.close()
 
 
 async def main():
@@ -12,9 +12,6 @@ from unittest.mock import Mock, patch, MagicMock
 from fastapi.responses import RedirectResponse
 from fastapi import HTTPException
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.core.error_handling import (
     create_safe_redirect,
     log_and_redirect_on_error,
@@ -71,7 +68,55 @@ class TestCreateSafeRedirect:
         assert "Service+temporarily+unavailable" in location or "Service%20temporarily%20unavailable" in location
         
         print("✅ Safe redirect with flash message works correctly")
-    
+
+    @patch('apps.core.error_handling.get_settings')
+    def test_create_safe_redirect_flash_with_existing_query(self, mock_get_settings):
+        """Test flash message is appended to a redirect URL that already has a query."""
+        # Mock settings
+        mock_settings = Mock()
+        mock_settings.DEFAULT_REDIRECT_URL = "https://default.example.com/home?tab=main"
+        mock_get_settings.return_value = mock_settings
+
+        result = create_safe_redirect(ValueError("boom"), flash_message="Try again & retry")
+
+        assert result.headers["location"] == (
+            "https://default.example.com/home?tab=main&flash=Try+again+%26+retry"
+        )
+
+        print("✅ Safe redirect with existing query works correctly")
+
+    @patch('apps.core.error_handling.get_settings')
+    def test_create_safe_redirect_flash_with_fragment(self, mock_get_settings):
+        """Test flash message goes into the query, before a SPA-style fragment."""
+        # Mock settings
+        mock_settings = Mock()
+        mock_settings.DEFAULT_REDIRECT_URL = "https://app.example.com/#/login"
+        mock_get_settings.return_value = mock_settings
+
+        result = create_safe_redirect(ValueError("boom"), flash_message="Session expired")
+
+        assert result.headers["location"] == (
+            "https://app.example.com/?flash=Session+expired#/login"
+        )
+
+        print("✅ Safe redirect with fragment works correctly")
+
+    @patch('apps.core.error_handling.get_settings')
+    def test_create_safe_redirect_replaces_existing_flash(self, mock_get_settings):
+        """Test an existing flash param is replaced rather than duplicated."""
+        # Mock settings
+        mock_settings = Mock()
+        mock_settings.DEFAULT_REDIRECT_URL = "https://default.example.com/home?flash=old&tab=main"
+        mock_get_settings.return_value = mock_settings
+
+        result = create_safe_redirect(ValueError("boom"), flash_message="new")
+
+        assert result.headers["location"] == (
+            "https://default.example.com/home?tab=main&flash=new"
+        )
+
+        print("✅ Safe redirect replaces existing flash correctly")
+
     @patch('apps.core.error_handling.get_settings')
     def test_create_safe_redirect_with_context(self, mock_get_settings):
         """Test safe redirect with context information."""
@@ -508,6 +553,8 @@ def run_all_tests():
         redirect_tests = TestCreateSafeRedirect()
         redirect_tests.test_create_safe_redirect_basic()
         redirect_tests.test_create_safe_redirect_with_flash_message()
+        redirect_tests.test_create_safe_redirect_flash_with_fragment()
+        redirect_tests.test_create_safe_redirect_replaces_existing_flash()
         redirect_tests.test_create_safe_redirect_with_context()
         redirect_tests.test_create_safe_redirect_auto_request_id()
         print()
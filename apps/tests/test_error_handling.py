@@ -15,9 +15,6 @@ import traceback
 from typing import Dict, Any
 from unittest.mock import Mock, patch, AsyncMock
 
-# Add project root to path
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.core.error_handling import (
     create_safe_redirect, 
     log_and_redirect_on_error,
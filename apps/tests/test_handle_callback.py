@@ -9,14 +9,10 @@ Test the enhanced handle_casdoor_callback to verify:
 import asyncio
 import time
 import pytest
-import sys
 import logging
 from unittest.mock import Mock, patch, AsyncMock
 from dataclasses import dataclass
 
-# Add the project path so we can import our modules
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.auth.services import handle_casdoor_callback
 from apps.integrations.n8n_db import CasdoorProfile
 
@@ -70,8 +66,7 @@ class TestHandleCasdoorCallback:
             
             mock_client_instance = Mock()
             mock_n8n_client.return_value = mock_client_instance
-            mock_client_instance.login_user.return_value = Mock(status_code=200)
-            mock_client_instance.close.return_value = None
+            mock_client_instance.login_user = AsyncMock(return_value=Mock(status_code=200))
             
             mock_extract_cookie.return_value = "n8n-auth-cookie-value"
             
@@ -139,8 +134,7 @@ class TestHandleCasdoorCallback:
             
             mock_client_instance = Mock()
             mock_n8n_client.return_value = mock_client_instance
-            mock_client_instance.login_user.return_value = Mock(status_code=200)
-            mock_client_instance.close.return_value = None
+            mock_client_instance.login_user = AsyncMock(return_value=Mock(status_code=200))
             
             mock_extract_cookie.return_value = "fresh-n8n-auth-cookie"
             
@@ -8,15 +8,13 @@ Covers the entire authentication flow with proper mocking of external services.
 
 import pytest
 import asyncio
+import orjson
 import uuid
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from fastapi.responses import RedirectResponse, HTMLResponse
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.main import app
 from apps.integrations.n8n_db import CasdoorProfile, N8nUserRow, N8nProjectRow
 
@@ -96,7 +94,7 @@ class TestCompleteAuthenticationFlow:
             
             mock_login_response = Mock()
             mock_login_response.status_code = 200
-            mock_n8n_client.login_user.return_value = mock_login_response
+            mock_n8n_client.login_user = AsyncMock(return_value=mock_login_response)
             
             # Mock cookie extraction
             mock_extract_cookie.return_value = "n8n_auth_cookie_xyz"
@@ -297,7 +295,7 @@ class TestErrorRecoveryFlows:
             mock_n8n_client_class.return_value = mock_n8n_client
             mock_login_response = Mock()
             mock_login_response.status_code = 200
-            mock_n8n_client.login_user.return_value = mock_login_response
+            mock_n8n_client.login_user = AsyncMock(return_value=mock_login_response)
             
             # Cookie extraction fails
             mock_extract_cookie.return_value = None
@@ -329,17 +327,13 @@ class TestErrorRecoveryFlows:
 class TestWebhookIntegration:
     """Test webhook integration scenarios."""
     
-    @patch('apps.auth.routers.handle_casdoor_logout_webhook')
+    @patch('apps.auth.routers.enqueue_webhook')
     @pytest.mark.asyncio
-    async def test_logout_webhook_integration(self, mock_handle_webhook):
+    async def test_logout_webhook_integration(self, mock_enqueue_webhook):
         """Test complete logout webhook processing."""
         
-        # Mock webhook handler
-        mock_handle_webhook.return_value = {
-            "status": "success",
-            "user_email": "webhook@example.com",
-            "sessions_invalidated": 1
-        }
+        # Mock webhook queue
+        mock_enqueue_webhook.return_value = True
         
         from apps.auth.routers import casdoor_webhook
         
@@ -351,14 +345,14 @@ class TestWebhookIntegration:
             "content-type": "application/json",
             "user-agent": "Casdoor-Webhook/1.0"
         }
-        webhook_request.json = AsyncMock(return_value={
+        webhook_request.body = AsyncMock(return_value=orjson.dumps({
             "action": "logout",
             "user": "webhook@example.com",
             "organization": "test_org",
             "application": "test_app",
             "id": "webhook_event_123",
             "timestamp": "2023-10-01T12:00:00Z"
-        })
+        }))
         
         # Test webhook processing
         result = await casdoor_webhook(webhook_request)
@@ -369,9 +363,9 @@ class TestWebhookIntegration:
         assert result["webhook_id"] == "webhook_event_123"
         assert "processing_id" in result
         
-        # Verify handler was called with correct payload
-        mock_handle_webhook.assert_called_once()
-        call_args = mock_handle_webhook.call_args[0][0]
+        # Verify payload was queued for background processing
+        mock_enqueue_webhook.assert_called_once()
+        call_args = mock_enqueue_webhook.call_args[0][0]
         assert call_args["action"] == "logout"
         assert call_args["user"] == "webhook@example.com"
         
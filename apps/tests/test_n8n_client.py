@@ -8,13 +8,12 @@ Covers login, logout, error handling, and edge cases.
 
 import pytest
 import httpx
-from unittest.mock import Mock, patch, MagicMock
+import asyncio
+import orjson
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from typing import Dict, Any
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
-from apps.integrations.n8n_client import N8NClient, N8NClientError
+from apps.integrations.n8n_client import N8NClient, N8NClientError, close_n8n_client, warm_n8n_client
 
 
 class TestN8NClientInitialization:
@@ -38,7 +37,7 @@ class TestN8NClientInitialization:
         client = N8NClient(base_url, timeout=custom_timeout)
         
         assert client.base_url == base_url
-        assert client._client.timeout.read == custom_timeout
+        assert client.timeout == custom_timeout
         
         print("✅ N8NClient initialization (custom timeout) works correctly")
     
@@ -54,10 +53,10 @@ class TestN8NClientInitialization:
         
         print("✅ Base URL normalization works correctly")
     
-    def test_headers_method(self):
-        """Test _headers method returns correct headers."""
+    def test_base_headers(self):
+        """Test base headers and auth cookie headers."""
         client = N8NClient("https://n8n.example.com")
-        headers = client._headers()
+        headers = client._auth_headers(None)
         
         expected_headers = {
             "Accept": "application/json",
@@ -65,6 +64,11 @@ class TestN8NClientInitialization:
         }
         
         assert headers == expected_headers
+        assert headers is N8NClient._BASE_HEADERS
+        
+        cookie_headers = client._auth_headers("abc")
+        assert cookie_headers == {**expected_headers, "Cookie": "n8n-auth=abc"}
+        assert "Cookie" not in N8NClient._BASE_HEADERS
         
         print("✅ Headers method works correctly")
 
@@ -72,11 +76,13 @@ class TestN8NClientInitialization:
 class TestN8NClientLogin:
     """Test N8NClient login functionality."""
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_login_user_success(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_login_user_success(self, mock_client_class):
         """Test successful user login."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock successful response
@@ -117,14 +123,15 @@ class TestN8NClientLogin:
         email = "test@example.com"
         password = "test_password"
         
-        result = client.login_user(email, password)
+        result = await client.login_user(email, password)
         
         # Verify request was made correctly
         mock_client.request.assert_called_once_with(
             "POST",
             "/rest/login",
             json={"emailOrLdapLoginId": email, "password": password},
-            headers={"Accept": "application/json", "Content-Type": "application/json"}
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            timeout=10.0
         )
         
         # Verify response
@@ -133,11 +140,13 @@ class TestN8NClientLogin:
         
         print("✅ User login (success) works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_login_user_failure(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_login_user_failure(self, mock_client_class):
         """Test failed user login."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock failed response
@@ -151,7 +160,7 @@ class TestN8NClientLogin:
         client = N8NClient("https://n8n.example.com")
         
         with pytest.raises(N8NClientError) as exc_info:
-            client.login_user("test@example.com", "wrong_password")
+            await client.login_user("test@example.com", "wrong_password")
         
         # Verify exception details
         assert exc_info.value.status == 401
@@ -159,11 +168,13 @@ class TestN8NClientLogin:
         
         print("✅ User login (failure) works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_login_user_network_error(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_login_user_network_error(self, mock_client_class):
         """Test login with network error."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock network error
@@ -173,7 +184,7 @@ class TestN8NClientLogin:
         client = N8NClient("https://n8n.example.com")
         
         with pytest.raises(httpx.RequestError):
-            client.login_user("test@example.com", "password")
+            await client.login_user("test@example.com", "password")
         
         print("✅ User login (network error) works correctly")
 
@@ -181,11 +192,13 @@ class TestN8NClientLogin:
 class TestN8NClientLogout:
     """Test N8NClient logout functionality."""
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_with_cookie(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_logout_user_with_cookie(self, mock_client_class):
         """Test user logout with auth cookie."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock successful response
@@ -199,7 +212,7 @@ class TestN8NClientLogout:
         client = N8NClient("https://n8n.example.com")
         auth_cookie = "test_cookie_value"
         
-        result = client.logout_user(auth_cookie)
+        result = await client.logout_user(auth_cookie)
         
         # Verify request was made correctly
         expected_headers = {
@@ -210,7 +223,8 @@ class TestN8NClientLogout:
         mock_client.request.assert_called_once_with(
             "POST",
             "/rest/logout",
-            headers=expected_headers
+            headers=expected_headers,
+            timeout=10.0
         )
         
         # Verify response
@@ -219,11 +233,13 @@ class TestN8NClientLogout:
         
         print("✅ User logout (with cookie) works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_without_cookie(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_logout_user_without_cookie(self, mock_client_class):
         """Test user logout without auth cookie."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock successful response
@@ -236,7 +252,7 @@ class TestN8NClientLogout:
         # Test logout
         client = N8NClient("https://n8n.example.com")
         
-        result = client.logout_user()
+        result = await client.logout_user()
         
         # Verify request was made correctly (no Cookie header)
         expected_headers = {
@@ -246,16 +262,19 @@ class TestN8NClientLogout:
         mock_client.request.assert_called_once_with(
             "POST",
             "/rest/logout",
-            headers=expected_headers
+            headers=expected_headers,
+            timeout=10.0
         )
         
         print("✅ User logout (without cookie) works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_network_error(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_logout_user_network_error(self, mock_client_class):
         """Test logout with network error."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         # Mock network error
@@ -265,7 +284,7 @@ class TestN8NClientLogout:
         client = N8NClient("https://n8n.example.com")
         
         with pytest.raises(N8NClientError) as exc_info:
-            client.logout_user("test_cookie")
+            await client.logout_user("test_cookie")
         
         # Verify exception details
         assert exc_info.value.status == 500
@@ -277,160 +296,145 @@ class TestN8NClientLogout:
 class TestN8NClientLogoutByEmail:
     """Test N8NClient logout by email functionality."""
     
-    @patch('asyncio.run')
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_by_email_success(self, mock_client_class, mock_asyncio_run):
-        """Test successful logout by email."""
+    @patch('apps.integrations.n8n_client.invalidate_user_sessions_db', new_callable=AsyncMock)
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_logout_user_by_email_success(self, mock_client_class, mock_invalidate):
+        """Test successful logout by email via session invalidation."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
-        # Mock database user lookup
-        mock_user_row = Mock()
-        mock_user_row.password = "user_password_hash"
-        mock_asyncio_run.return_value = "user_password_hash"
-        
-        # Mock login response
-        mock_login_response = Mock()
-        mock_login_response.status_code = 200
-        mock_login_response.cookies = {'n8n-auth': 'extracted_cookie'}
-        # Provide headers object compatible with dict() and get_list()
-        class HeadersMock:
-            def __init__(self):
-                self._data = {}
-            def get_list(self, key):
-                return []
-            def __iter__(self):
-                return iter(self._data.keys())
-            def keys(self):
-                return self._data.keys()
-            def items(self):
-                return self._data.items()
-            def __getitem__(self, key):
-                return self._data.get(key, '')
-            def get(self, key, default=None):
-                return self._data.get(key, default)
-        mock_login_response.headers = HeadersMock()
-        
-        # Mock logout response
-        mock_logout_response = Mock()
-        mock_logout_response.status_code = 200
-        mock_logout_response.text = '{"success": true}'
-        # Ensure headers dict-friendly for logging in logout_user
-        mock_logout_response.headers = {}
-        
-        # Setup client request side effects
-        mock_client.request.side_effect = [
-            mock_login_response,  # Login request
-            mock_logout_response  # Logout request
-        ]
+        # Mock successful password rotation
+        mock_invalidate.return_value = True
         
         # Test logout by email
         client = N8NClient("https://n8n.example.com")
         
-        result = client.logout_user_by_email("test@example.com")
+        result = await client.logout_user_by_email("test@example.com")
         
-        # Verify calls
-        assert mock_client.request.call_count == 2  # Login + Logout
-        assert result == mock_logout_response
+        # Verify sessions were invalidated without any n8n HTTP round-trips
+        mock_invalidate.assert_awaited_once_with("test@example.com")
+        mock_client.request.assert_not_called()
+        assert result.status_code == 200
+        assert result.json() == {"success": True}
         
         print("✅ User logout by email (success) works correctly")
     
-    @patch('asyncio.run')
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_by_email_user_not_found(self, mock_client_class, mock_asyncio_run):
-        """Test logout by email when user not found."""
+    @patch('apps.integrations.n8n_client.invalidate_user_sessions_db', new_callable=AsyncMock)
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_logout_user_by_email_user_not_found(self, mock_client_class, mock_invalidate):
+        """Test logout by email when the user cannot be invalidated."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
-        # Mock database user lookup failure
-        mock_asyncio_run.side_effect = Exception("User not found")
-        
-        # Mock fallback logout response
-        mock_logout_response = Mock()
-        mock_logout_response.status_code = 200
-        mock_logout_response.text = "ok"
-        mock_logout_response.headers = {}
-        mock_client.request.return_value = mock_logout_response
+        # Mock no user updated
+        mock_invalidate.return_value = False
         
         # Test logout by email
         client = N8NClient("https://n8n.example.com")
         
-        result = client.logout_user_by_email("nonexistent@example.com")
+        result = await client.logout_user_by_email("nonexistent@example.com")
         
-        # Verify fallback logout was called
-        mock_client.request.assert_called_once()
-        assert result == mock_logout_response
+        # Verify failure is reported through the status code
+        assert result.status_code == 500
+        assert result.json() == {"success": False}
+        mock_client.request.assert_not_called()
         
         print("✅ User logout by email (user not found) works correctly")
+
+
+class TestN8NClientClose:
+    """Test shared client cleanup functionality."""
     
-    @patch('asyncio.run')
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_logout_user_by_email_login_failure(self, mock_client_class, mock_asyncio_run):
-        """Test logout by email when login fails."""
-        # Setup mock client
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_async_context_manager_keeps_shared_client(self, mock_client_class):
+        """Test leaving an async with block does not close the shared client."""
         mock_client = Mock()
+        mock_client.aclose = AsyncMock()
         mock_client_class.return_value = mock_client
         
-        # Mock database user lookup success
-        mock_asyncio_run.return_value = "user_password"
+        async with N8NClient("https://n8n.example.com") as client:
+            assert client._client is mock_client
         
-        # Mock login failure
-        mock_login_response = Mock()
-        mock_login_response.status_code = 401
-        mock_login_response.text = "Unauthorized"
-        mock_client.request.side_effect = [
-            N8NClientError(401, "Login failed"),  # Login fails
-            Mock(status_code=200, text="ok", headers={})  # Fallback logout succeeds
-        ]
+        mock_client.aclose.assert_not_called()
         
-        # Test logout by email
-        client = N8NClient("https://n8n.example.com")
+        print("✅ Client async context manager works correctly")
+    
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_warm_client_hits_healthz(self, mock_client_class):
+        """Test startup warm-up opens a connection via the health endpoint."""
+        mock_client = Mock()
+        mock_client.get = AsyncMock(return_value=Mock(status_code=200))
+        mock_client_class.return_value = mock_client
         
-        result = client.logout_user_by_email("test@example.com")
+        await warm_n8n_client("https://n8n.example.com")
         
-        # Verify fallback was used
-        assert mock_client.request.call_count >= 1
+        mock_client_class.assert_called_once_with("https://n8n.example.com")
+        mock_client.get.assert_awaited_once_with("/healthz")
         
-        print("✅ User logout by email (login failure) works correctly")
-
-
-class TestN8NClientClose:
-    """Test N8NClient cleanup functionality."""
+        print("✅ Client warm-up works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_close_success(self, mock_client_class):
-        """Test successful client cleanup."""
-        # Setup mock client
+    @pytest.mark.asyncio
+    async def test_close_success(self):
+        """Test shared client is closed and reset."""
         mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        # Test close
-        client = N8NClient("https://n8n.example.com")
-        client.close()
+        mock_client.aclose = AsyncMock()
         
-        # Verify close was called
-        mock_client.close.assert_called_once()
+        with patch('apps.integrations.n8n_client._async_client', mock_client):
+            await close_n8n_client()
+            
+            # Verify close was called and the singleton was reset
+            mock_client.aclose.assert_called_once()
+            from apps.integrations import n8n_client as n8n_client_module
+            assert n8n_client_module._async_client is None
         
         print("✅ Client close (success) works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_close_with_exception(self, mock_client_class):
-        """Test client cleanup with exception."""
-        # Setup mock client
+    @pytest.mark.asyncio
+    async def test_close_with_exception(self):
+        """Test shared client cleanup with exception."""
+        mock_client = Mock()
+        mock_client.aclose = AsyncMock(side_effect=Exception("Close error"))
+        
+        with patch('apps.integrations.n8n_client._async_client', mock_client):
+            await close_n8n_client()  # Should not raise
+            
+            # Verify close was attempted
+            mock_client.aclose.assert_called_once()
+        
+        print("✅ Client close (with exception) works correctly")
+
+
+class TestN8NClientWorkflows:
+    """Test N8NClient workflow operations."""
+    
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_import_workflow_sends_orjson_body(self, mock_client_class):
+        """Test workflow import encodes the payload once with orjson."""
         mock_client = Mock()
-        mock_client.close.side_effect = Exception("Close error")
+        mock_client.request = AsyncMock(return_value=Mock(status_code=200))
         mock_client_class.return_value = mock_client
         
-        # Test close (should not raise exception)
+        workflow = {"name": "Welcome", "nodes": [{"id": "n1", "type": "start"}], "connections": {}}
         client = N8NClient("https://n8n.example.com")
-        client.close()  # Should not raise
+        result = await client.import_workflow(workflow, auth_cookie="cookie123")
         
-        # Verify close was attempted
-        mock_client.close.assert_called_once()
+        assert result.status_code == 200
+        call_kwargs = mock_client.request.call_args.kwargs
+        assert "json" not in call_kwargs
+        assert orjson.loads(call_kwargs["content"]) == workflow
+        assert call_kwargs["headers"]["Content-Type"] == "application/json"
+        assert call_kwargs["headers"]["Cookie"] == "n8n-auth=cookie123"
         
-        print("✅ Client close (with exception) works correctly")
+        print("✅ Workflow import (orjson body) works correctly")
 
 
 class TestN8NClientError:
@@ -467,11 +471,13 @@ class TestN8NClientError:
 class TestEdgeCases:
     """Test edge cases and boundary conditions."""
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_empty_credentials(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_empty_credentials(self, mock_client_class):
         """Test login with empty credentials."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         mock_response = Mock()
@@ -483,15 +489,17 @@ class TestEdgeCases:
         client = N8NClient("https://n8n.example.com")
         
         with pytest.raises(N8NClientError):
-            client.login_user("", "")
+            await client.login_user("", "")
         
         print("✅ Empty credentials handling works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_very_long_credentials(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_very_long_credentials(self, mock_client_class):
         """Test login with very long credentials."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         mock_response = Mock()
@@ -522,16 +530,18 @@ class TestEdgeCases:
         long_email = "a" * 1000 + "@example.com"
         long_password = "p" * 1000
         
-        result = client.login_user(long_email, long_password)
+        result = await client.login_user(long_email, long_password)
         assert result.status_code == 200
         
         print("✅ Long credentials handling works correctly")
     
-    @patch('apps.integrations.n8n_client.httpx.Client')
-    def test_special_characters_in_credentials(self, mock_client_class):
+    @patch('apps.integrations.n8n_client.get_n8n_client')
+    @pytest.mark.asyncio
+    async def test_special_characters_in_credentials(self, mock_client_class):
         """Test login with special characters in credentials."""
         # Setup mock client
         mock_client = Mock()
+        mock_client.request = AsyncMock()
         mock_client_class.return_value = mock_client
         
         mock_response = Mock()
@@ -561,13 +571,13 @@ class TestEdgeCases:
         special_email = "test+tag@example.com"
         special_password = "p@ssw0rd!#$%^&*()"
         
-        result = client.login_user(special_email, special_password)
+        result = await client.login_user(special_email, special_password)
         assert result.status_code == 200
         
         print("✅ Special characters in credentials handled correctly")
 
 
-def run_all_tests():
+async def run_all_tests():
     """Run all N8NClient tests."""
     print("🌐 Starting N8NClient Test Suite...")
     print("=" * 50)
@@ -578,34 +588,33 @@ def run_all_tests():
         init_tests.test_client_initialization_default()
         init_tests.test_client_initialization_custom_timeout()
         init_tests.test_client_base_url_normalization()
-        init_tests.test_headers_method()
+        init_tests.test_base_headers()
         print()
         
         # Test login functionality
         login_tests = TestN8NClientLogin()
-        login_tests.test_login_user_success()
-        login_tests.test_login_user_failure()
-        login_tests.test_login_user_network_error()
+        await login_tests.test_login_user_success()
+        await login_tests.test_login_user_failure()
+        await login_tests.test_login_user_network_error()
         print()
         
         # Test logout functionality
         logout_tests = TestN8NClientLogout()
-        logout_tests.test_logout_user_with_cookie()
-        logout_tests.test_logout_user_without_cookie()
-        logout_tests.test_logout_user_network_error()
+        await logout_tests.test_logout_user_with_cookie()
+        await logout_tests.test_logout_user_without_cookie()
+        await logout_tests.test_logout_user_network_error()
         print()
         
         # Test logout by email
         logout_email_tests = TestN8NClientLogoutByEmail()
-        logout_email_tests.test_logout_user_by_email_success()
-        logout_email_tests.test_logout_user_by_email_user_not_found()
-        logout_email_tests.test_logout_user_by_email_login_failure()
+        await logout_email_tests.test_logout_user_by_email_success()
+        await logout_email_tests.test_logout_user_by_email_user_not_found()
         print()
         
         # Test cleanup
         close_tests = TestN8NClientClose()
-        close_tests.test_close_success()
-        close_tests.test_close_with_exception()
+        await close_tests.test_close_success()
+        await close_tests.test_close_with_exception()
         print()
         
         # Test error handling
@@ -616,9 +625,9 @@ def run_all_tests():
         
         # Test edge cases
         edge_tests = TestEdgeCases()
-        edge_tests.test_empty_credentials()
-        edge_tests.test_very_long_credentials()
-        edge_tests.test_special_characters_in_credentials()
+        await edge_tests.test_empty_credentials()
+        await edge_tests.test_very_long_credentials()
+        await edge_tests.test_special_characters_in_credentials()
         print()
         
         print("🎉 All N8NClient tests passed!")
@@ -642,7 +651,7 @@ if __name__ == "__main__":
     print("🌐 n8n SSO Gateway - N8NClient Test Suite")
     print("=" * 50)
     
-    success = run_all_tests()
+    success = asyncio.run(run_all_tests())
     
     if success:
         print("\n" + "=" * 50)
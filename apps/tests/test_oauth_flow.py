@@ -19,9 +19,6 @@ import uuid
 from unittest.mock import Mock, AsyncMock, patch
 from typing import List, Dict, Any
 
-# Add project root to path
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from apps.auth.oauth_state import (
     OAuthStateManager,
     CallbackProcessor, 
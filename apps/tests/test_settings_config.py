@@ -12,10 +12,8 @@ from unittest.mock import Mock, patch, MagicMock
 from pydantic import ValidationError
 from typing import Optional
 
-import sys
-sys.path.insert(0, '/Users/mohmdfo/dev/sharif/n8n-sso-gateway')
-
 from conf.settings import Settings, get_settings
+from conf.env import env_bool
 from pydantic_settings import BaseSettings
 from pydantic import AnyHttpUrl
 
@@ -422,6 +420,22 @@ class TestSettingsEdgeCases:
         print("✅ Settings with extra fields works correctly")
 
 
+class TestEnvBool:
+    """Test boolean environment flag parsing."""
+    
+    @patch.dict(os.environ, {"FLAG_A": "Yes", "FLAG_B": " on ", "FLAG_C": "0", "FLAG_D": "false"})
+    def test_env_bool_values(self):
+        """Test truthy/falsy spellings and the unset default."""
+        assert env_bool("FLAG_A", False) is True
+        assert env_bool("FLAG_B", False) is True
+        assert env_bool("FLAG_C", True) is False
+        assert env_bool("FLAG_D", True) is False
+        assert env_bool("FLAG_UNSET_FOR_TEST", True) is True
+        assert env_bool("FLAG_UNSET_FOR_TEST", False) is False
+        
+        print("✅ env_bool parsing works correctly")
+
+
 class TestSettingsIntegration:
     """Test Settings integration scenarios."""
     
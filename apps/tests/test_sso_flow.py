@@ -29,7 +29,7 @@ async def test_n8n_cookie_extraction():
         print(f"🔐 Attempting login for: {settings.N8N_OWNER_EMAIL}")
         
         # Login to n8n
-        response = n8n_client.login_user(
+        response = await n8n_client.login_user(
             email=settings.N8N_OWNER_EMAIL,
             password=settings.N8N_OWNER_PASSWORD
         )
@@ -82,8 +82,6 @@ async def test_n8n_cookie_extraction():
     except Exception as e:
         print(f"❌ Login failed: {e}")
         return False
-    finally:
-        n8n_client.close()
 
 async def main():
     """Main test function."""
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the background Casdoor webhook queue.
+
+Covers enqueueing, back-pressure when the queue is full, and worker processing.
+"""
+
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from apps.auth import webhook_queue
+
+
+class TestWebhookQueue:
+    """Test webhook queue enqueue and worker behaviour."""
+
+    def test_enqueue_webhook_success(self):
+        """Test payload is queued when there is room."""
+        test_queue = asyncio.Queue(maxsize=2)
+
+        with patch.object(webhook_queue, 'queue', test_queue):
+            assert webhook_queue.enqueue_webhook({"id": 1, "action": "logout"}) is True
+            assert test_queue.qsize() == 1
+
+        print("✅ Webhook enqueue (success) works correctly")
+
+    def test_enqueue_webhook_queue_full(self):
+        """Test payload is rejected when the queue is full."""
+        test_queue = asyncio.Queue(maxsize=1)
+
+        with patch.object(webhook_queue, 'queue', test_queue):
+            assert webhook_queue.enqueue_webhook({"id": 1, "action": "logout"}) is True
+            assert webhook_queue.enqueue_webhook({"id": 2, "action": "logout"}) is False
+            assert test_queue.qsize() == 1
+
+        print("✅ Webhook enqueue (queue full) works correctly")
+
+    @pytest.mark.asyncio
+    async def test_worker_processes_and_survives_errors(self):
+        """Test worker processes payloads and keeps running after a failure."""
+        test_queue = asyncio.Queue()
+        handler = AsyncMock(side_effect=[Exception("n8n down"), {"status": "success"}])
+
+        with patch.object(webhook_queue, 'queue', test_queue), \
+             patch.object(webhook_queue, 'handle_casdoor_logout_webhook', handler):
+            test_queue.put_nowait({"id": 1, "action": "logout"})
+            test_queue.put_nowait({"id": 2, "action": "logout"})
+
+            task = asyncio.create_task(webhook_queue.worker(0))
+            await asyncio.wait_for(test_queue.join(), timeout=1.0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert handler.await_count == 2
+
+        print("✅ Webhook worker (error isolation) works correctly")
+
+    @pytest.mark.asyncio
+    async def test_stop_drains_queued_payloads(self):
+        """Test shutdown processes already-queued payloads before stopping workers."""
+        test_queue = asyncio.Queue()
+        handler = AsyncMock(return_value={"status": "success"})
+
+        with patch.object(webhook_queue, 'queue', test_queue), \
+             patch.object(webhook_queue, '_workers', []), \
+             patch.object(webhook_queue, '_accepting', True), \
+             patch.object(webhook_queue, 'handle_casdoor_logout_webhook', handler):
+            assert webhook_queue.enqueue_webhook({"id": 1, "action": "logout"}) is True
+
+            webhook_queue.start_webhook_workers(count=1)
+            await webhook_queue.stop_webhook_workers(timeout=1.0)
+
+            assert webhook_queue.accepting_webhooks() is False
+            assert webhook_queue._workers == []
+
+        handler.assert_awaited_once_with({"id": 1, "action": "logout"})
+
+        print("✅ Webhook shutdown (drains queue) works correctly")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for Casdoor webhook services.
+
+Covers payload parsing, logout coalescing and session invalidation.
+"""
+
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+from apps.auth import webhook_services
+
+
+class TestCasdoorWebhookPayload:
+    """Test Casdoor webhook payload parsing."""
+
+    def test_payload_uses_extended_user(self):
+        """Test user fields come from extendedUser when present."""
+        payload = webhook_services.CasdoorWebhookPayload({
+            "id": 42,
+            "action": "logout",
+            "extendedUser": {"email": "test@example.com", "name": "test", "displayName": "Test User"}
+        })
+
+        assert payload.user_email == "test@example.com"
+        assert payload.user_name == "test"
+        assert payload.display_name == "Test User"
+        assert payload.is_logout_event()
+        assert not hasattr(payload, "__dict__")
+
+        print("✅ Webhook payload (extendedUser) works correctly")
+
+    def test_payload_falls_back_to_object(self):
+        """Test user fields fall back to the object field."""
+        payload = webhook_services.CasdoorWebhookPayload({
+            "action": "logout",
+            "extendedUser": None,
+            "object": {"email": "obj@example.com", "name": "obj", "displayName": "Obj User"}
+        })
+
+        assert payload.user_email == "obj@example.com"
+        assert payload.display_name == "Obj User"
+
+        print("✅ Webhook payload (object fallback) works correctly")
+
+    def test_payload_display_name_from_first_last(self):
+        """Test display name is built from first/last name and stripped."""
+        payload = webhook_services.CasdoorWebhookPayload({
+            "action": "logout",
+            "object": {"email": "obj@example.com", "firstName": "Obj", "lastName": ""}
+        })
+
+        assert payload.display_name == "Obj"
+
+        print("✅ Webhook payload (display name fallback) works correctly")
+
+
+class TestLogoutSingleFlight:
+    """Test concurrent logout webhooks for the same user are coalesced."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_logouts_share_one_run(self):
+        """Test two concurrent webhooks for one email run the logout once."""
+        release = asyncio.Event()
+
+        async def slow_logout(user_email, request_id):
+            await release.wait()
+            return {"status": "success", "user_email": user_email}
+
+        payload = {"id": 1, "action": "logout", "extendedUser": {"email": "test@example.com"}}
+
+        with patch.object(webhook_services, '_logout_user_everywhere',
+                          AsyncMock(side_effect=slow_logout)) as mock_logout:
+            first = asyncio.create_task(webhook_services.handle_casdoor_logout_webhook(payload))
+            second = asyncio.create_task(webhook_services.handle_casdoor_logout_webhook(dict(payload, id=2)))
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(first, second)
+
+        assert mock_logout.await_count == 1
+        assert results[0] == results[1] == {"status": "success", "user_email": "test@example.com"}
+        assert not webhook_services._inflight_logouts
+
+        print("✅ Logout single-flight works correctly")
+
+
+class TestNonLogoutFastPath:
+    """Test non-logout webhooks are ignored before payload parsing."""
+
+    @pytest.mark.asyncio
+    async def test_non_logout_event_ignored(self):
+        """Test non-logout events return ignored without building a payload."""
+        with patch.object(webhook_services, 'CasdoorWebhookPayload') as mock_payload_class:
+            result = await webhook_services.handle_casdoor_logout_webhook({"action": "login"})
+
+        assert result == {"status": "ignored", "reason": "not_logout_event"}
+        mock_payload_class.assert_not_called()
+
+        print("✅ Non-logout webhook fast path works correctly")
+
+
+class TestLogoutUserEverywhere:
+    """Test webhook logout via n8n session invalidation."""
+
+    @pytest.mark.asyncio
+    @patch('apps.auth.webhook_services.N8NClient')
+    async def test_logout_success(self, mock_client_class):
+        """Test successful invalidation reports success."""
+        mock_client_class.return_value.logout_user_by_email = AsyncMock(return_value=Mock(status_code=200))
+
+        with patch.object(webhook_services, 'get_settings', return_value=Mock(N8N_BASE_URL="https://n8n.example.com")):
+            result = await webhook_services._logout_user_everywhere("test@example.com", "req1")
+
+        assert result["status"] == "success"
+        assert result["method"] == "database_invalidation"
+        mock_client_class.return_value.logout_user_by_email.assert_awaited_once_with("test@example.com")
+
+        print("✅ Webhook logout (success) works correctly")
+
+    @pytest.mark.asyncio
+    @patch('apps.auth.webhook_services.N8NClient')
+    async def test_logout_failure(self, mock_client_class):
+        """Test failed invalidation is reported as an error."""
+        mock_client_class.return_value.logout_user_by_email = AsyncMock(return_value=Mock(status_code=500))
+
+        with patch.object(webhook_services, 'get_settings', return_value=Mock(N8N_BASE_URL="https://n8n.example.com")):
+            result = await webhook_services._logout_user_everywhere("test@example.com", "req2")
+
+        assert result["status"] == "error"
+        assert result["db_status"] == "failed"
+
+        print("✅ Webhook logout (failure) works correctly")
@@ -0,0 +1,14 @@
+"""Helpers for reading raw environment flags outside of Settings."""
+from __future__ import annotations
+
+import os
+
+_TRUTHY = frozenset({"true", "1", "yes", "on", "y", "t"})
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean flag from the environment; unset means ``default``."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in _TRUTHY